@@ -2,36 +2,217 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import csv
+import hmac
+import io
 import json
+import os
 import sys
+import time
+from functools import lru_cache, wraps
+from hashlib import md5, sha256
+from datetime import datetime, timedelta
+from itertools import groupby
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from dateutil.rrule import rrulestr
+import babel.dates
+import pytz
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, g, \
+    make_response, session
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from jinja2 import FileSystemBytecodeCache
 from flask_migrate import Migrate
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.hybrid import hybrid_method
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import is_resource_modified
+import click
+import gzip
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from config import configs, config_name
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import redis
+except ImportError:
+    redis = None
+from search import SearchIndex, prefix_tsquery
+from cache import LRUCache, PageCache
+from scheduling import Calendar
+from profiling import QueryProfiler, recorded_queries
+from metrics import Metrics
+from routing import RoutingSQLAlchemy
+from assets import Assets
+from images import THUMBNAIL_SIZES, DiskCache, FileSystemOrigin, HTTPOrigin, NotAnImage, OriginError, image_mimetype, \
+    thumbnail
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config.from_object(configs[config_name])
+# the jinja environment was created by Moment before the config was loaded; without
+# auto reload every template is compiled once per process instead of being checked
+# for changes on each render. With TEMPLATE_BYTECODE_CACHE_DIR set the compiled code
+# is also kept on disk across restarts (see "flask compile-templates").
+app.jinja_env.auto_reload = app.templates_auto_reload
+if app.config.get("TEMPLATE_BYTECODE_CACHE_DIR"):
+    os.makedirs(app.config["TEMPLATE_BYTECODE_CACHE_DIR"], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["TEMPLATE_BYTECODE_CACHE_DIR"])
+# queries of the views wrapped in @db.router.reads go to a read replica when
+# REPLICA_URIS is set, everything else to the primary
+db = RoutingSQLAlchemy(app)
 
 migrate = Migrate(app, db)
+query_profiler = QueryProfiler(app)
+metrics = Metrics(app, db)
+assets = Assets(app)
+
+# relationships are never loaded implicitly with their parent; views ask for what they
+# need with loader options. With RAISE_ON_LAZY_LOAD set, any lazy load a view did not
+# ask for raises instead of quietly issuing one more query per row.
+relationship_lazy = "raise" if app.config.get("RAISE_ON_LAZY_LOAD") else "select"
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
 
-class Venue(db.Model):
+def utc_now():
+    return datetime.now(pytz.utc)
+
+
+class UTCDateTime(db.TypeDecorator):
+    # A timestamptz on PostgreSQL. Databases without time zone support (SQLite) store
+    # the UTC time and return naive datetimes, which are made aware again on load so
+    # they compare with utc_now().
+    impl = db.DateTime(timezone=True)
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None and dialect.name != "postgresql":
+            value = value.astimezone(pytz.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = pytz.utc.localize(value)
+        return value
+
+
+
+class ShowListingMixin:
+    # Past/upcoming show counts and listings for Venue and Artist, computed in the
+    # database. Subclasses set show_key to the Show column referencing them and
+    # implement counterpart() to return the model on the other side of a show.
+
+    @classmethod
+    def show_filter(cls, id, upcoming, now):
+        when = Show.start_time > now if upcoming else Show.start_time <= now
+        return db.and_(getattr(Show, cls.show_key) == id, when)
+
+    @hybrid_method
+    def num_upcoming_shows(self, now):
+        return Show.query.filter(self.show_filter(self.id, True, now)).count()
+
+    @num_upcoming_shows.expression
+    def num_upcoming_shows(cls, now):
+        return db.select([db.func.count(Show.id)]).where(cls.show_filter(cls.id, True, now)).as_scalar()
+
+    @hybrid_method
+    def num_past_shows(self, now):
+        return Show.query.filter(self.show_filter(self.id, False, now)).count()
+
+    @num_past_shows.expression
+    def num_past_shows(cls, now):
+        return db.select([db.func.count(Show.id)]).where(cls.show_filter(cls.id, False, now)).as_scalar()
+
+    @classmethod
+    def upcoming_shows_count_column(cls, now):
+        # the stored counter when SHOW_COUNTERS is on, otherwise a count over Show
+        if app.config["SHOW_COUNTERS"]:
+            return cls.upcoming_shows_counter
+        return cls.num_upcoming_shows(now)
+
+    @classmethod
+    def refresh_show_counters(cls, now, ids=None):
+        # recompute upcoming_shows_counter from Show for the given ids, or every row
+        query = cls.query
+        if ids is not None:
+            query = query.filter(cls.id.in_(ids))
+        # updated_at is kept: it marks edits of the row, and its onupdate would otherwise
+        # touch every row on each refresh
+        query.update({cls.upcoming_shows_counter: cls.num_upcoming_shows(now), cls.updated_at: cls.updated_at},
+                     synchronize_session=False)
+
+    @classmethod
+    def page_version(cls, id, now):
+        # ETag of a detail page: the latest updated_at of the row, its shows and their
+        # counterparts, plus show counts so that deleted shows and shows moving from
+        # upcoming to past change it as well. None if the row doesn't exist.
+        other, other_key = cls.counterpart()
+        row = db.session.query(
+            cls.updated_at,
+            db.func.max(Show.updated_at),
+            db.func.max(other.updated_at),
+            db.func.count(Show.id),
+            db.func.count(Show.id).filter(Show.start_time > now)
+        ).outerjoin(Show, getattr(Show, cls.show_key) == cls.id) \
+            .outerjoin(other, other.id == getattr(Show, other_key)) \
+            .filter(cls.id == id) \
+            .group_by(cls.id) \
+            .first()
+        if row is None:
+            return None
+        return md5(f"{cls.__tablename__}:{id}:{tuple(row)}".encode("utf-8")).hexdigest()
+
+    @classmethod
+    def shows_query(cls, id, now, upcoming, limit=None):
+        # soonest upcoming / most recent past shows first, with the counterpart's
+        # id, name and image labelled e.g. artist_id, artist_name, artist_image_link
+        other, other_key = cls.counterpart()
+        prefix = other.__tablename__.lower()
+        query = db.session.query(
+            other.id.label(f"{prefix}_id"),
+            other.name.label(f"{prefix}_name"),
+            other.image_link.label(f"{prefix}_image_link"),
+            *([other.timezone.label(f"{prefix}_timezone")] if other is Venue else []),
+            Show.start_time
+        ).join(Show, getattr(Show, other_key) == other.id) \
+            .filter(cls.show_filter(id, upcoming, now)) \
+            .order_by(Show.start_time if upcoming else db.desc(Show.start_time))
+        if limit:
+            query = query.limit(limit)
+        return query
+
+    def list_shows(self, now, upcoming, limit=None):
+        return [row._asdict() for row in self.shows_query(self.id, now, upcoming, limit)]
+
+
+venue_genres = db.Table(
+    'VenueGenre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genre_genre_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table(
+    'ArtistGenre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genre_genre_id', 'genre_id', 'artist_id')
+)
+
+
+class Venue(ShowListingMixin, db.Model):
     __tablename__ = 'Venue'
+    show_key = 'venue_id'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -39,35 +220,63 @@ class Venue(db.Model):
     state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String, nullable=False)
+    genres = db.relationship("Genre", secondary=venue_genres, lazy=relationship_lazy,
+                             order_by="Genre.name", passive_deletes=True)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
+    # IANA name; show times are stored in UTC and entered and shown in the venue's time
+    timezone = db.Column(db.String(64), nullable=False, default="UTC", server_default="UTC")
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    shows = db.relationship("Show", backref="venues", lazy=False, cascade="all, delete-orphan")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    upcoming_shows_counter = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    shows = db.relationship("Show", backref=db.backref("venues", lazy=relationship_lazy),
+                            lazy=relationship_lazy, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        db.Index('ix_venue_state_city', 'state', 'city'),
+        db.Index('ix_venue_created_at', created_at.desc()),
+    )
+
+    @staticmethod
+    def counterpart():
+        return Artist, 'artist_id'
 
     def __repr__(self):
         return f"<Venue id={self.id} name={self.name} city={self.city} state={self.city}> \n"
 
 
-class Artist(db.Model):
+class Artist(ShowListingMixin, db.Model):
     __tablename__ = 'Artist'
+    show_key = 'artist_id'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120), nullable=False)
+    genres = db.relationship("Genre", secondary=artist_genres, lazy=relationship_lazy,
+                             order_by="Genre.name", passive_deletes=True)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    shows = db.relationship("Show", backref="artists", lazy=False, cascade="all, delete-orphan")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    upcoming_shows_counter = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    shows = db.relationship("Show", backref=db.backref("artists", lazy=relationship_lazy),
+                            lazy=relationship_lazy, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        db.Index('ix_artist_created_at', created_at.desc()),
+    )
+
+    @staticmethod
+    def counterpart():
+        return Venue, 'venue_id'
 
 
 class Show(db.Model):
@@ -76,24 +285,132 @@ class Show(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id"), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    start_time = db.Column(UTCDateTime, nullable=False, default=utc_now)
+    # shows of one venue or one artist never overlap; on PostgreSQL this is also enforced
+    # by exclusion constraints on tstzrange(start_time, end_time), see the migrations
+    end_time = db.Column(UTCDateTime, nullable=False)
+    series_id = db.Column(db.Integer, db.ForeignKey("ShowSeries.id", ondelete="SET NULL"), index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
 
     def __repr__(self):
         return f"<Show id={self.id} artist_id={self.artist_id} venue_id={self.venue_id} start_time={self.start_time}"
 
 
+class ShowSeries(db.Model):
+    # A recurring show: its occurrences follow an RFC 5545 RRULE (e.g.
+    # "FREQ=WEEKLY;INTERVAL=1;COUNT=12") from start_time. Occurrences are inserted as
+    # Show rows up to a horizon; materialized_until records how far that has got.
+    # Both are wall clock times at the venue, so a weekly show keeps its hour across
+    # daylight saving changes.
+    __tablename__ = "ShowSeries"
+
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id", ondelete="CASCADE"), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id", ondelete="CASCADE"), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    duration = db.Column(db.Integer, nullable=False) # minutes
+    rule = db.Column(db.String(200), nullable=False)
+    materialized_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def pending_occurrences(self, horizon):
+        # start times of occurrences not materialized yet, up to horizon
+        occurrences = rrulestr(self.rule, dtstart=self.start_time)
+        if self.materialized_until is None:
+            return occurrences.between(self.start_time, horizon, inc=True)
+        return occurrences.between(self.materialized_until, horizon, inc=False)
+
+    def __repr__(self):
+        return f"<ShowSeries id={self.id} artist_id={self.artist_id} venue_id={self.venue_id} rule={self.rule}>"
+
+
+class Genre(db.Model):
+    __tablename__ = "Genre"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def from_names(cls, names):
+        # Genre rows for the given names, creating the ones that don't exist yet
+        genres = cls.query.filter(cls.name.in_(names)).all()
+        existing = {genre.name for genre in genres}
+        for name in names:
+            if name not in existing:
+                genres.append(cls(name=name))
+                existing.add(name)
+        return genres
+
+    def __repr__(self):
+        return f"<Genre id={self.id} name={self.name}>"
+
+
+# rendered pages of the read-only views, invalidated by tag from the write views;
+# shared by every process through Redis when PAGE_CACHE_REDIS_URL is set
+if app.config["PAGE_CACHE_REDIS_URL"]:
+    if redis is None:
+        raise RuntimeError("PAGE_CACHE_REDIS_URL needs the redis package")
+    page_cache_backend = redis.Redis.from_url(app.config["PAGE_CACHE_REDIS_URL"])
+else:
+    page_cache_backend = LRUCache(app.config["PAGE_CACHE_MAX_ENTRIES"], app.config["PAGE_CACHE_TIMEOUT"])
+page_cache = PageCache(page_cache_backend, timeout=app.config["PAGE_CACHE_TIMEOUT"])
+metrics.register("fyyur_page_cache_hits_total", "Pages served from the page cache.",
+                 lambda: page_cache.hits, type="counter")
+metrics.register("fyyur_page_cache_misses_total", "Cacheable pages rendered by their view.",
+                 lambda: page_cache.misses, type="counter")
+metrics.register("fyyur_page_cache_entries", "Pages held in the page cache.",
+                 lambda: page_cache.stats().get("entries", 0))
+
+# in-process search fallback for databases other than PostgreSQL
+venue_search_index = SearchIndex(lambda: db.session.query(Venue.id, Venue.name, Venue.city, Venue.state),
+                                 app.config["SEARCH_INDEX_TIMEOUT"])
+artist_search_index = SearchIndex(lambda: db.session.query(Artist.id, Artist.name, Artist.city, Artist.state),
+                                  app.config["SEARCH_INDEX_TIMEOUT"])
+
+# thumbnails of the venue and artist image links, see the image view
+if app.config["IMAGE_ORIGIN_DIR"]:
+    image_origin = FileSystemOrigin(app.config["IMAGE_ORIGIN_DIR"])
+else:
+    image_origin = HTTPOrigin(app.config["IMAGE_FETCH_TIMEOUT"], app.config["IMAGE_MAX_ORIGIN_BYTES"])
+image_cache = DiskCache(app.config["IMAGE_CACHE_DIR"], app.config["IMAGE_CACHE_MAX_BYTES"])
+
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def datetime_formatter(format, locale):
+    # parsed Babel pattern and locale, built once per (format, locale)
+    pattern = babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+    return pattern, babel.Locale.parse(locale)
+
+
+def format_datetime(value, format='medium', locale=None, tzinfo=None):
+    # value is a datetime (strings are still parsed, slowly); format is 'full', 'medium'
+    # or a Babel pattern. Timezone aware values are shown in tzinfo when it is given.
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    if tzinfo is not None and value.tzinfo is not None:
+        if isinstance(tzinfo, str):
+            tzinfo = babel.dates.get_timezone(tzinfo)
+        value = value.astimezone(tzinfo)
+    pattern, locale = datetime_formatter(format, locale or app.config["DATETIME_LOCALE"])
+    return pattern.apply(value, locale)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
@@ -107,15 +424,335 @@ def orm_obj_list_to_dict(obj_list):
         print ("\n" , u.__dict__ , "\n")
 
 
+def request_now():
+    # one "now" per request, so every past/upcoming comparison in it agrees
+    if "now" not in g:
+        g.now = utc_now()
+    return g.now
+
+
+def conditional_page(model, id_arg):
+    # answer If-None-Match with a 304 before the page is rendered, using
+    # model.page_version() of the row named by the view argument id_arg. There is no
+    # Last-Modified: deleted shows and shows moving from upcoming to past change the
+    # page without any updated_at advancing, so If-Modified-Since can't be answered.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            etag = model.page_version(view_args[id_arg], request_now())
+            if etag is None:
+                abort(404)
+            g.page_etag = etag  # part of the page cache key
+
+            # pages with pending flashed messages must always be rendered
+            if not session.get("_flashes") and not is_resource_modified(request.environ, etag=etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(**view_args))
+            response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def venue_timezones(venue_ids):
+    rows = db.session.query(Venue.id, Venue.timezone).filter(Venue.id.in_(venue_ids))
+    return {id: pytz.timezone(name) for id, name in rows}
+
+
+def venue_timezone(venue_id):
+    return venue_timezones([venue_id]).get(int(venue_id), pytz.utc)
+
+
+def to_utc(local_time, tz):
+    # a wall clock time entered for a venue in tz, as an aware UTC datetime
+    return tz.localize(local_time).astimezone(pytz.utc)
+
+
+def show_conflict(venue_id, artist_id, start_time, end_time):
+    # an existing show overlapping [start_time, end_time) at the venue or with the artist.
+    # No show lasts longer than MAX_SHOW_DURATION, so only shows starting within that
+    # window can overlap, which keeps this a short range scan of the start_time indexes.
+    earliest = start_time - timedelta(minutes=MAX_SHOW_DURATION)
+    return Show.query.options(db.raiseload("*")).filter(
+        db.or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+        Show.start_time > earliest,
+        Show.start_time < end_time,
+        Show.end_time > start_time
+    ).first()
+
+
+def show_calendars(rows):
+    # Calendar of every venue and artist in rows (keyed ("venue", id) / ("artist", id)),
+    # holding their existing shows around the rows' time span
+    earliest = min(row["start_time"] for row in rows) - timedelta(minutes=MAX_SHOW_DURATION)
+    latest = max(row["end_time"] for row in rows)
+    venue_ids = {row["venue_id"] for row in rows}
+    artist_ids = {row["artist_id"] for row in rows}
+    booked = db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.end_time).filter(
+        db.or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids)),
+        Show.start_time > earliest,
+        Show.start_time < latest
+    )
+
+    intervals = {}
+    for venue_id, artist_id, start_time, end_time in booked:
+        intervals.setdefault(("venue", venue_id), []).append((start_time, end_time))
+        intervals.setdefault(("artist", artist_id), []).append((start_time, end_time))
+    calendars = {key: Calendar(intervals.get(key, ())) for key in
+                 [("venue", id) for id in venue_ids] + [("artist", id) for id in artist_ids]}
+    return calendars
+
+
+def series_rule(form):
+    # RRULE for the recurrence picked on a ShowSeriesForm
+    rule = f"FREQ={form.frequency.data};INTERVAL={form.interval.data}"
+    if form.occurrences.data:
+        rule += f";COUNT={form.occurrences.data}"
+    if form.until.data:
+        rule += f";UNTIL={form.until.data:%Y%m%d}T235959"
+    return rule
+
+
+def materialize_series(series, horizon):
+    # insert the series' shows starting up to horizon (UTC) in one multi-row INSERT,
+    # skipping occurrences that overlap other shows; returns the (inserted, conflicting)
+    # start times, in the venue's time
+    now = datetime.utcnow()
+    tz = venue_timezone(series.venue_id)
+    local_horizon = horizon.astimezone(tz).replace(tzinfo=None)
+    occurrences = []
+    for local_time in series.pending_occurrences(local_horizon):
+        start_time = to_utc(local_time, tz)
+        occurrences.append((local_time, {
+            "artist_id": series.artist_id,
+            "venue_id": series.venue_id,
+            "start_time": start_time,
+            "end_time": start_time + timedelta(minutes=series.duration),
+            "series_id": series.id,
+            "updated_at": now
+        }))
+
+    inserted, conflicting, accepted = [], [], []
+    if occurrences:
+        calendars = show_calendars([row for _, row in occurrences])
+        for local_time, row in occurrences:
+            keys = (("venue", row["venue_id"]), ("artist", row["artist_id"]))
+            if any(calendars[key].conflict(row["start_time"], row["end_time"]) for key in keys):
+                conflicting.append(local_time)
+                continue
+            for key in keys:
+                calendars[key].add(row["start_time"], row["end_time"])
+            inserted.append(local_time)
+            accepted.append(row)
+    if accepted:
+        db.session.execute(Show.__table__.insert().values(accepted))
+    series.materialized_until = local_horizon
+    return inserted, conflicting
+
+
+def series_horizon():
+    return utc_now() + timedelta(days=app.config["SERIES_HORIZON_DAYS"])
+
+
+def venue_areas_query(now, genre=None):
+    # one grouped round trip: every venue with its upcoming show count, ordered so
+    # that venues of the same city/state are adjacent and can be grouped in a single pass
+    if app.config["SHOW_COUNTERS"]:
+        query = db.session.query(
+            Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_shows_counter
+        )
+    else:
+        num_upcoming_shows = db.func.count(Show.id).filter(Show.start_time > now)
+        query = db.session.query(
+            Venue.city, Venue.state, Venue.id, Venue.name, num_upcoming_shows
+        ).outerjoin(Show, Show.venue_id == Venue.id).group_by(Venue.id)
+    if genre:
+        query = query.filter(Venue.id.in_(genre_members(venue_genres.c.venue_id, genre)))
+    return query.order_by(Venue.state, Venue.city, Venue.id)
+
+
+def venue_areas(now, genre=None):
+    rows = venue_areas_query(now, genre).all()
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+        areas.append({
+            "city": city,
+            "state": state,
+            "venues": [
+                {"id": id, "name": name, "num_upcoming_shows": count}
+                for _, _, id, name, count in venues
+            ]
+        })
+    return areas
+
+
+def genre_members(member_column, genre):
+    # ids (from an association table column) tagged with the named genre, answered from
+    # the unique Genre.name index and the (genre_id, member id) association index
+    return db.session.query(member_column) \
+        .join(Genre, Genre.id == member_column.table.c.genre_id) \
+        .filter(Genre.name == genre)
+
+
+def search_document(model):
+    # must match the expression indexed by the search migration, or PostgreSQL won't use the index
+    return db.func.to_tsvector(db.literal_column("'simple'::regconfig"),
+                               model.name + " " + model.city + " " + model.state)
+
+
+def search_catalog(model, fallback_index, term, page):
+    # returns (total matches, ids on the requested page) ranked best match first
+    per_page = app.config["SEARCH_RESULTS_PER_PAGE"]
+    offset = (max(page, 1) - 1) * per_page
+
+    if db.engine.dialect.name != "postgresql":
+        ids = fallback_index.search(term)
+        return len(ids), ids[offset:offset + per_page]
+
+    query, ranked = search_queries(model, term)
+    count = query.count()
+    return count, [id for id, in ranked.limit(per_page).offset(offset)]
+
+
+def like_escape(text):
+    # text matched literally by LIKE ... ESCAPE '\'
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_queries(model, term):
+    # PostgreSQL full text search: (ids matching term, the same ranked best match first)
+    query = db.session.query(model.id)
+    tsquery = prefix_tsquery(term)
+    if not tsquery:
+        return query, query.order_by(model.name, model.id)
+    document = search_document(model)
+    match = db.func.to_tsquery(db.literal_column("'simple'::regconfig"), tsquery)
+    query = query.filter(document.op("@@")(match) | model.name.ilike(f"%{like_escape(term)}%", escape="\\"))
+    ranked = query.order_by(
+        db.desc(db.func.ts_rank(document, match) + db.func.similarity(model.name, term)),
+        model.id
+    )
+    return query, ranked
+
+
+def show_listing_columns():
+    # the venue and artist columns are only joined in when one of theirs is selected
+    return {
+        "id": Show.id,
+        "start_time": Show.start_time,
+        "end_time": Show.end_time,
+        "venue_id": Show.venue_id,
+        "venue_name": Venue.name,
+        "venue_timezone": Venue.timezone,
+        "artist_id": Show.artist_id,
+        "artist_name": Artist.name,
+        "artist_image_link": Artist.image_link,
+    }
+
+
+def shows_listing_query(fields=None):
+    # shows with the fields named (all of show_listing_columns() by default), ordered by
+    # (start_time, id), narrowed by the request's ?from= / ?to= dates and starting after
+    # its ?after= keyset cursor
+    try:
+        after = decode_show_cursor(request.args.get("after"))
+        date_from = parse_date_arg("from")
+        date_to = parse_date_arg("to")
+    except ValueError:
+        abort(400)
+
+    columns = show_listing_columns()
+    fields = fields or list(columns)
+    query = db.session.query(*(columns[field].label(field) for field in fields))
+    tables = {columns[field].class_ for field in fields}
+    if Venue in tables:
+        query = query.join(Venue, Show.venue_id == Venue.id)
+    if Artist in tables:
+        query = query.join(Artist, Show.artist_id == Artist.id)
+
+    if date_from:
+        query = query.filter(Show.start_time >= date_from)
+    if date_to:
+        query = query.filter(Show.start_time < date_to + timedelta(days=1)) # "to" date is inclusive
+    if after:
+        start_time, show_id = after
+        query = query.filter(db.or_(
+            Show.start_time > start_time,
+            db.and_(Show.start_time == start_time, Show.id > show_id)
+        ))
+    return query.order_by(Show.start_time, Show.id)
+
+
+def stream_template(template_name, **context):
+    # render a template chunk by chunk so the first bytes go out before the whole page is built
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(5)
+    return stream
+
+
+def parse_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    # dates are days in UTC
+    return pytz.utc.localize(datetime.strptime(value, "%Y-%m-%d"))
+
+
+def encode_show_cursor(start_time, show_id):
+    return f"{start_time.isoformat()}_{show_id}"
+
+
+def decode_show_cursor(cursor):
+    if not cursor:
+        return None
+    start_time, show_id = cursor.rsplit("_", 1)
+    start_time = datetime.fromisoformat(start_time)
+    if start_time.tzinfo is None:
+        start_time = pytz.utc.localize(start_time)
+    return start_time, int(show_id)
+
+
+class ShowPage:
+    # Iterates one keyset page of show rows ordered by (start_time, id) without building
+    # the whole page up front. Once exhausted, next_cursor points at the following page.
+
+    def __init__(self, query, per_page):
+        self.query = query.limit(per_page + 1)
+        self.per_page = per_page
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        for count, row in enumerate(self.query.yield_per(100)):
+            if count == self.per_page:
+                self.next_cursor = encode_show_cursor(last.start_time, last.id)
+                break
+            last = row
+            yield {
+                "venue_id": row.venue_id,
+                "venue_name": row.venue_name,
+                "venue_timezone": row.venue_timezone,
+                "artist_id": row.artist_id,
+                "artist_name": row.artist_name,
+                "artist_image_link": row.artist_image_link,
+                "start_time": row.start_time
+            }
+
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 
 @app.route('/')
+@db.router.reads
+@page_cache.cached(lambda: ('venues', 'artists'))
 def index():
-    venues = Venue.query.order_by(db.desc(Venue.created_at)).limit(10).all()
-    artists = Artist.query.order_by(db.desc(Artist.created_at)).limit(10).all()
+    venues = Venue.query.options(db.raiseload("*")).order_by(db.desc(Venue.created_at)).limit(10).all()
+    artists = Artist.query.options(db.raiseload("*")).order_by(db.desc(Artist.created_at)).limit(10).all()
     return render_template('pages/home.html', venues=venues, artists=artists)
 
 
@@ -125,63 +762,28 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@db.router.reads
+@page_cache.cached(lambda: ('venues', 'shows'))
 def venues():
-    data = []
-    results = Venue.query.distinct(Venue.city, Venue.state).all()
-    for result in results:
-        city_state_unit = {
-            "city": result.city,
-            "state": result.state
-        }
-        venues = Venue.query.filter_by(city=result.city, state=result.state).all()
-
-        # format each venue
-        formatted_venues = []
-        for venue in venues:
-            formatted_venues.append({
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), venue.shows)))
-            })
-        
-        city_state_unit["venues"] = formatted_venues
-        data.append(city_state_unit)
-   
-    return render_template('pages/venues.html', areas=data)
+    genre = request.args.get("genre")
+    return render_template('pages/venues.html', areas=venue_areas(request_now(), genre), genre=genre)
 
 
 @app.route('/venues/<int:venue_id>')
+@db.router.reads
+@conditional_page(Venue, 'venue_id')
+@page_cache.cached(lambda venue_id: (f'venue:{venue_id}',))
 def show_venue(venue_id):
-    venue = Venue.query.get(venue_id)
-    setattr(venue, "genres", venue.genres.split(",")) # convert genre string back to array
-
-    # get past shows
-    past_shows = list(filter(lambda show: show.start_time < datetime.now(), venue.shows))
-    temp_shows = []
-    for show in past_shows:
-        temp = {}
-        temp["artist_name"] = show.artists.name
-        temp["artist_id"] = show.artists.id
-        temp["artist_image_link"] = show.artists.image_link
-        temp["start_time"] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-        temp_shows.append(temp)
-
-    setattr(venue, "past_shows", temp_shows)
-    setattr(venue,"past_shows_count", len(past_shows))
-
-    # get future shows
-    upcoming_shows = list(filter(lambda show: show.start_time > datetime.now(), venue.shows))
-    temp_shows = []
-    for show in upcoming_shows:
-        temp = {}
-        temp["artist_name"] = show.artists.name
-        temp["artist_id"] = show.artists.id
-        temp["artist_image_link"] = show.artists.image_link
-        temp["start_time"] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-        temp_shows.append(temp)
+    now = request_now()
+    limit = app.config["DETAIL_PAGE_SHOWS"]
+    venue, past_shows_count, upcoming_shows_count = db.session.query(
+        Venue, Venue.num_past_shows(now), Venue.num_upcoming_shows(now)
+    ).options(db.selectinload(Venue.genres), db.raiseload("*")).filter(Venue.id == venue_id).first_or_404()
 
-    setattr(venue, "upcoming_shows", temp_shows)    
-    setattr(venue,"upcoming_shows_count", len(upcoming_shows))
+    setattr(venue, "past_shows", venue.list_shows(now, upcoming=False, limit=limit))
+    setattr(venue, "past_shows_count", past_shows_count)
+    setattr(venue, "upcoming_shows", venue.list_shows(now, upcoming=True, limit=limit))
+    setattr(venue, "upcoming_shows_count", upcoming_shows_count)
 
     return render_template('pages/show_venue.html', venue=venue)
 
@@ -207,15 +809,18 @@ def create_venue_submission():
                 state=form.state.data,
                 address=form.address.data,
                 phone=form.phone.data,
-                genres=",".join(form.genres.data), # convert array to string separated by commas
+                genres=Genre.from_names(form.genres.data),
                 facebook_link=form.facebook_link.data,
                 image_link=form.image_link.data,
                 seeking_talent=form.seeking_talent.data,
                 seeking_description=form.seeking_description.data,
+                timezone=form.timezone.data,
                 website=form.website.data
             )
             db.session.add(new_venue)
             db.session.commit()
+            venue_search_index.invalidate()
+            page_cache.invalidate('venues')
             flash('Venue ' + request.form['name'] + ' was successfully listed!')
 
         except Exception:
@@ -238,8 +843,9 @@ def create_venue_submission():
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
-    venue = Venue.query.get(venue_id)
-    form.genres.data = venue.genres.split(",") # convert genre string back to array
+    venue = Venue.query.options(db.selectinload(Venue.genres)).get(venue_id)
+    form.genres.data = [genre.name for genre in venue.genres]
+    form.timezone.data = venue.timezone
     
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
@@ -250,22 +856,28 @@ def edit_venue_submission(venue_id):
     
     if form.validate():
         try:
-            venue = Venue.query.get(venue_id)
+            venue = Venue.query.options(db.selectinload(Venue.genres)).get(venue_id)
 
             venue.name = form.name.data
             venue.city=form.city.data
             venue.state=form.state.data
             venue.address=form.address.data
             venue.phone=form.phone.data
-            venue.genres=",".join(form.genres.data) # convert array to string separated by commas
+            venue.genres=Genre.from_names(form.genres.data)
             venue.facebook_link=form.facebook_link.data
             venue.image_link=form.image_link.data
             venue.seeking_talent=form.seeking_talent.data
             venue.seeking_description=form.seeking_description.data
+            venue.timezone=form.timezone.data
             venue.website=form.website.data
+            venue.updated_at=datetime.utcnow() # genre changes alone don't update the row
 
             db.session.add(venue)
             db.session.commit()
+            venue_search_index.invalidate()
+            # the venue's name also shows on the pages of artists playing there
+            artist_ids = [id for id, in db.session.query(Show.artist_id).filter_by(venue_id=venue_id).distinct()]
+            page_cache.invalidate('venues', 'shows', f'venue:{venue_id}', *(f'artist:{id}' for id in artist_ids))
 
             flash("Venue " + form.name.data + " edited successfully")
             
@@ -289,9 +901,14 @@ def edit_venue_submission(venue_id):
 @app.route("/venues/<venue_id>/delete", methods={"GET"})
 def delete_venue(venue_id):
     try:
-        venue = Venue.query.get(venue_id)
+        venue = Venue.query.options(db.selectinload(Venue.shows)).get(venue_id)
+        artist_ids = {show.artist_id for show in venue.shows}
         db.session.delete(venue)
+        db.session.flush()
+        Artist.refresh_show_counters(request_now(), artist_ids)
         db.session.commit()
+        venue_search_index.invalidate()
+        page_cache.invalidate('venues', 'shows', f'venue:{venue_id}', *(f'artist:{id}' for id in artist_ids))
         flash("Venue " + venue.name + " was deleted successfully!")
     except:
         db.session.rollback()
@@ -306,28 +923,32 @@ def delete_venue(venue_id):
 #  Search Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
+@db.router.reads
 def search_venues():
-    search_term = request.form.get("search_term", "")
+    search_term = request.values.get("search_term", "")
+    page = request.args.get("page", 1, type=int)
+
+    count, venue_ids = search_catalog(Venue, venue_search_index, search_term, page)
+    venues = db.session.query(
+        Venue.id, Venue.name, Venue.upcoming_shows_count_column(request_now())
+    ).filter(Venue.id.in_(venue_ids)).all()
+    venues.sort(key=lambda venue: venue_ids.index(venue.id)) # keep search ranking
 
     response = {}
-    venues = list(Venue.query.filter(
-        Venue.name.ilike(f"%{search_term}%") |
-        Venue.state.ilike(f"%{search_term}%") |
-        Venue.city.ilike(f"%{search_term}%") 
-    ).all())
-    response["count"] = len(venues)
+    response["count"] = count
     response["data"] = []
 
-    for venue in venues:
+    for id, name, num_upcoming_shows in venues:
         venue_unit = {
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), venue.shows)))
+            "id": id,
+            "name": name,
+            "num_upcoming_shows": num_upcoming_shows
         }
         response["data"].append(venue_unit)
 
-    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+    return render_template('pages/search_venues.html', results=response, search_term=search_term,
+                           page=page, has_next=page * app.config["SEARCH_RESULTS_PER_PAGE"] < count)
 
 
 
@@ -337,47 +958,32 @@ def search_venues():
 
 
 @app.route('/artists')
+@db.router.reads
+@page_cache.cached(lambda: ('artists',))
 def artists():
-    artists = db.session.query(Artist.id, Artist.name).all()
-    return render_template('pages/artists.html', artists=artists)
+    genre = request.args.get("genre")
+    query = db.session.query(Artist.id, Artist.name)
+    if genre:
+        query = query.filter(Artist.id.in_(genre_members(artist_genres.c.artist_id, genre)))
+    artists = query.all()
+    return render_template('pages/artists.html', artists=artists, genre=genre)
 
 
 @app.route('/artists/<int:artist_id>')
+@db.router.reads
+@conditional_page(Artist, 'artist_id')
+@page_cache.cached(lambda artist_id: (f'artist:{artist_id}',))
 def show_artist(artist_id):
+    now = request_now()
+    limit = app.config["DETAIL_PAGE_SHOWS"]
+    artist, past_shows_count, upcoming_shows_count = db.session.query(
+        Artist, Artist.num_past_shows(now), Artist.num_upcoming_shows(now)
+    ).options(db.selectinload(Artist.genres), db.raiseload("*")).filter(Artist.id == artist_id).first_or_404()
 
-    artist = Artist.query.get(artist_id)
-    setattr(artist, "genres", artist.genres.split(",")) # convert genre string back to array
-
-    # get past shows
-    past_shows = list(filter(lambda show: show.start_time < datetime.now(), artist.shows))
-    temp_shows = []
-    for show in past_shows:
-        temp = {}
-        temp["venue_name"] = show.venues.name
-        temp["venue_id"] = show.venues.id
-        temp["venue_image_link"] = show.venues.image_link
-        temp["start_time"] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-
-        temp_shows.append(temp)
-
-    setattr(artist, "past_shows", temp_shows)
-    setattr(artist, "past_shows_count", len(past_shows))
-
-
-    # get upcoming shows
-    upcoming_shows = list(filter(lambda show: show.start_time > datetime.now(), artist.shows))
-    temp_shows = []
-    for show in upcoming_shows:
-        temp = {}
-        temp["venue_name"] = show.venues.name
-        temp["venue_id"] = show.venues.id
-        temp["venue_image_link"] = show.venues.image_link
-        temp["start_time"] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-
-        temp_shows.append(temp)
-
-    setattr(artist, "upcoming_shows", temp_shows)
-    setattr(artist, "upcoming_shows_count", len(upcoming_shows))
+    setattr(artist, "past_shows", artist.list_shows(now, upcoming=False, limit=limit))
+    setattr(artist, "past_shows_count", past_shows_count)
+    setattr(artist, "upcoming_shows", artist.list_shows(now, upcoming=True, limit=limit))
+    setattr(artist, "upcoming_shows_count", upcoming_shows_count)
 
     return render_template('pages/show_artist.html', artist=artist)
 
@@ -403,7 +1009,7 @@ def create_artist_submission():
                 city=form.city.data,
                 state=form.state.data,
                 phone=form.phone.data,
-                genres=",".join(form.genres.data), # convert array to string separated by commas
+                genres=Genre.from_names(form.genres.data),
                 image_link=form.image_link.data,
                 facebook_link=form.facebook_link.data,
                 website=form.website.data,
@@ -412,6 +1018,8 @@ def create_artist_submission():
             )
             db.session.add(new_artist)
             db.session.commit()
+            artist_search_index.invalidate()
+            page_cache.invalidate('artists')
             flash("Artist " + request.form["name"] + " was successfully listed!")
         except Exception:
             db.session.rollback()
@@ -432,8 +1040,8 @@ def create_artist_submission():
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()  
-    artist = Artist.query.get(artist_id)
-    form.genres.data = artist.genres.split(",") # convert genre string back to array
+    artist = Artist.query.options(db.selectinload(Artist.genres)).get(artist_id)
+    form.genres.data = [genre.name for genre in artist.genres]
     
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
@@ -444,21 +1052,26 @@ def edit_artist_submission(artist_id):
 
     if form.validate():
         try:
-            artist = Artist.query.get(artist_id)
+            artist = Artist.query.options(db.selectinload(Artist.genres)).get(artist_id)
 
             artist.name = form.name.data
             artist.city=form.city.data
             artist.state=form.state.data
             artist.phone=form.phone.data
-            artist.genres=",".join(form.genres.data) # convert array to string separated by commas
+            artist.genres=Genre.from_names(form.genres.data)
             artist.facebook_link=form.facebook_link.data
             artist.image_link=form.image_link.data
             artist.seeking_venue=form.seeking_venue.data
             artist.seeking_description=form.seeking_description.data
             artist.website=form.website.data
+            artist.updated_at=datetime.utcnow() # genre changes alone don't update the row
 
             db.session.add(artist)
             db.session.commit()
+            artist_search_index.invalidate()
+            # the artist's name and image also show on the pages of venues they play at
+            venue_ids = [id for id, in db.session.query(Show.venue_id).filter_by(artist_id=artist_id).distinct()]
+            page_cache.invalidate('artists', 'shows', f'artist:{artist_id}', *(f'venue:{id}' for id in venue_ids))
             flash("Artist " + artist.name + " was successfully edited!")
         except:
             db.session.rollback()
@@ -479,9 +1092,14 @@ def edit_artist_submission(artist_id):
 @app.route("/artists/<artist_id>/delete", methods=["GET"])
 def delete_artist(artist_id):
     try:
-        artist = Artist.query.get(artist_id)
+        artist = Artist.query.options(db.selectinload(Artist.shows)).get(artist_id)
+        venue_ids = {show.venue_id for show in artist.shows}
         db.session.delete(artist)
+        db.session.flush()
+        Venue.refresh_show_counters(request_now(), venue_ids)
         db.session.commit()
+        artist_search_index.invalidate()
+        page_cache.invalidate('artists', 'shows', f'artist:{artist_id}', *(f'venue:{id}' for id in venue_ids))
         flash("Artist " + artist.name+ " was deleted successfully!")
     except:
         db.session.rollback()
@@ -497,33 +1115,33 @@ def delete_artist(artist_id):
 #  Search Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
+@db.router.reads
 def search_artists():
-    search_term = request.form.get('search_term', '')
-    artists = Artist.query.filter(
-        Artist.name.ilike(f"%{search_term}%") |
-        Artist.city.ilike(f"%{search_term}%") |
-        Artist.state.ilike(f"%{search_term}%")
-    ).all()
+    search_term = request.values.get('search_term', '')
+    page = request.args.get("page", 1, type=int)
+
+    count, artist_ids = search_catalog(Artist, artist_search_index, search_term, page)
+    artists = db.session.query(
+        Artist.id, Artist.name, Artist.upcoming_shows_count_column(request_now())
+    ).filter(Artist.id.in_(artist_ids)).all()
+    artists.sort(key=lambda artist: artist_ids.index(artist.id)) # keep search ranking
+
     response = {
-        "count": len(artists),
+        "count": count,
         "data": []
     }
 
-    for artist in artists:
+    for id, name, upcoming_shows in artists:
         temp = {}
-        temp["name"] = artist.name
-        temp["id"] = artist.id
-
-        upcoming_shows = 0
-        for show in artist.shows:
-            if show.start_time > datetime.now():
-                upcoming_shows = upcoming_shows + 1
+        temp["name"] = name
+        temp["id"] = id
         temp["upcoming_shows"] = upcoming_shows
 
         response["data"].append(temp)
 
-    return render_template('pages/search_artists.html', results=response, search_term=search_term)
+    return render_template('pages/search_artists.html', results=response, search_term=search_term,
+                           page=page, has_next=page * app.config["SEARCH_RESULTS_PER_PAGE"] < count)
 
 
 
@@ -533,22 +1151,20 @@ def search_artists():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@db.router.reads
+@page_cache.cached(lambda: ('shows', 'venues', 'artists'))
 def shows():
-    data = []
+    query = shows_listing_query()
 
-    shows = Show.query.all()
-    for show in shows:
-        temp = {}
-        temp["venue_id"] = show.venues.id
-        temp["venue_name"] = show.venues.name
-        temp["artist_id"] = show.artists.id
-        temp["artist_name"] = show.artists.name
-        temp["artist_image_link"] = show.artists.image_link
-        temp["start_time"] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-        
-        data.append(temp)
-    
-    return render_template('pages/shows.html', shows=data)
+    # carried over to the next page link
+    filters = {key: request.args[key] for key in ("from", "to", "stream") if request.args.get(key)}
+    page = ShowPage(query, app.config["SHOWS_PER_PAGE"])
+
+    if request.args.get("stream"):
+        return Response(stream_with_context(
+            stream_template('pages/shows.html', shows=page, filters=filters)
+        ))
+    return render_template('pages/shows.html', shows=page, filters=filters)
 
 
 @app.route('/shows/create')
@@ -564,14 +1180,44 @@ def create_show_submission():
     
     if form.validate():
         try:
+            # the form's time is the venue's wall clock time
+            start_time = to_utc(form.start_time.data, venue_timezone(form.venue_id.data))
+            end_time = start_time + timedelta(minutes=form.duration.data)
+            conflict = show_conflict(form.venue_id.data, form.artist_id.data, start_time, end_time)
+            if conflict:
+                # in the time of the conflicting show's venue, which is the venue entered
+                # unless the artist is booked elsewhere
+                tz = venue_timezone(conflict.venue_id)
+                flash(f'Show was not listed: it overlaps show {conflict.id} '
+                      f'({conflict.start_time.astimezone(tz):%m/%d/%Y %H:%M} - '
+                      f'{conflict.end_time.astimezone(tz):%H:%M %Z}) of the venue or artist.')
+                return redirect(url_for("create_shows"))
+
             new_show = Show(
                 artist_id=form.artist_id.data,
                 venue_id=form.venue_id.data,
-                start_time=form.start_time.data
+                start_time=start_time,
+                end_time=end_time
             )
             db.session.add(new_show)
+            if new_show.start_time > request_now():
+                for model, id in ((Venue, new_show.venue_id), (Artist, new_show.artist_id)):
+                    model.query.filter_by(id=id).update(
+                        {model.upcoming_shows_counter: model.upcoming_shows_counter + 1,
+                         model.updated_at: model.updated_at},
+                        synchronize_session=False
+                    )
             db.session.commit()
+            page_cache.invalidate('shows', 'venues', f'venue:{form.venue_id.data}', f'artist:{form.artist_id.data}')
             flash('Show was successfully listed!')
+        except IntegrityError as error:
+            db.session.rollback()
+            print(sys.exc_info())
+            if getattr(error.orig, "pgcode", None) == "23P01":
+                # lost a race with a concurrent booking, caught by the exclusion constraints
+                flash('Show was not listed: it overlaps another show of the venue or artist.')
+            else:
+                flash('Show was not successfully listed.')
         except Exception:
             db.session.rollback()
             print(sys.exc_info())
@@ -585,6 +1231,492 @@ def create_show_submission():
     return redirect(url_for("index"))
 
 
+#  Show Series
+#  ----------------------------------------------------------------
+
+@app.route('/shows/series/create')
+def create_series():
+    form = ShowSeriesForm()
+    return render_template('forms/new_series.html', form=form)
+
+
+@app.route('/shows/series/create', methods=['POST'])
+def create_series_submission():
+    form = ShowSeriesForm(request.form)
+
+    if form.validate():
+        try:
+            series = ShowSeries(
+                artist_id=int(form.artist_id.data),
+                venue_id=int(form.venue_id.data),
+                start_time=form.start_time.data,
+                duration=form.duration.data,
+                rule=series_rule(form)
+            )
+            db.session.add(series)
+            db.session.flush()
+
+            # the whole series is created in one transaction, or not at all
+            inserted, conflicting = materialize_series(series, series_horizon())
+            if conflicting:
+                db.session.rollback()
+                flash(f'Series was not listed: the show on {conflicting[0]:%m/%d/%Y %H:%M} '
+                      f'overlaps another show of the venue or artist.')
+                return redirect(url_for("create_series"))
+
+            Venue.refresh_show_counters(request_now(), [series.venue_id])
+            Artist.refresh_show_counters(request_now(), [series.artist_id])
+            db.session.commit()
+            page_cache.invalidate('shows', 'venues', f'venue:{series.venue_id}', f'artist:{series.artist_id}')
+            flash(f'Series was successfully listed with {len(inserted)} shows!')
+            return redirect(url_for("show_series", series_id=series.id))
+        except Exception:
+            db.session.rollback()
+            print(sys.exc_info())
+            flash('Series was not successfully listed.')
+        finally:
+            db.session.close()
+    else:
+        print(form.errors)
+        flash('Series was not successfully listed.')
+
+    return redirect(url_for("index"))
+
+
+@app.route('/shows/series/<int:series_id>')
+@db.router.reads
+def show_series(series_id):
+    series = ShowSeries.query.get_or_404(series_id)
+    upcoming_shows = db.session.query(Show.id, Show.start_time, Show.end_time) \
+        .filter(Show.series_id == series_id, Show.start_time > request_now()) \
+        .order_by(Show.start_time) \
+        .limit(app.config["DETAIL_PAGE_SHOWS"]) \
+        .all()
+    return render_template('pages/show_series.html', series=series, upcoming_shows=upcoming_shows,
+                           timezone=venue_timezone(series.venue_id).zone)
+
+
+@app.route('/shows/series/<int:series_id>/edit', methods=['GET'])
+def edit_series(series_id):
+    series = ShowSeries.query.get_or_404(series_id)
+    form = ShowSeriesForm(obj=series)
+    rule = dict(part.split("=", 1) for part in series.rule.split(";"))
+    form.frequency.data = rule["FREQ"]
+    form.interval.data = int(rule.get("INTERVAL", 1))
+    form.occurrences.data = int(rule["COUNT"]) if "COUNT" in rule else None
+    form.until.data = datetime.strptime(rule["UNTIL"][:8], "%Y%m%d").date() if "UNTIL" in rule else None
+    return render_template('forms/edit_series.html', form=form, series=series)
+
+
+@app.route('/shows/series/<int:series_id>/edit', methods=['POST'])
+def edit_series_submission(series_id):
+    series = ShowSeries.query.get_or_404(series_id)
+    form = ShowSeriesForm(request.form)
+
+    if form.validate():
+        try:
+            now = request_now()
+            affected = {("venue", series.venue_id), ("artist", series.artist_id)}
+
+            # replace every upcoming occurrence in one transaction; past shows are kept
+            Show.query.filter(Show.series_id == series_id, Show.start_time > now) \
+                .delete(synchronize_session=False)
+            series.artist_id = int(form.artist_id.data)
+            series.venue_id = int(form.venue_id.data)
+            series.start_time = form.start_time.data
+            series.duration = form.duration.data
+            series.rule = series_rule(form)
+            # occurrences from now on, in the (possibly new) venue's time
+            local_now = now.astimezone(venue_timezone(series.venue_id)).replace(tzinfo=None)
+            series.materialized_until = max(local_now, series.start_time - timedelta(microseconds=1))
+            db.session.flush()
+
+            inserted, conflicting = materialize_series(series, series_horizon())
+            if conflicting:
+                db.session.rollback()
+                flash(f'Series was not edited: the show on {conflicting[0]:%m/%d/%Y %H:%M} '
+                      f'overlaps another show of the venue or artist.')
+                return redirect(url_for("edit_series", series_id=series_id))
+
+            affected |= {("venue", series.venue_id), ("artist", series.artist_id)}
+            Venue.refresh_show_counters(now, [id for kind, id in affected if kind == "venue"])
+            Artist.refresh_show_counters(now, [id for kind, id in affected if kind == "artist"])
+            db.session.commit()
+            page_cache.invalidate('shows', 'venues', *(f'{kind}:{id}' for kind, id in affected))
+            flash(f'Series was successfully edited, {len(inserted)} upcoming shows listed.')
+        except Exception:
+            db.session.rollback()
+            print(sys.exc_info())
+            flash('Series was not edited successfully.')
+        finally:
+            db.session.close()
+    else:
+        print(form.errors)
+        flash('Series was not edited successfully.')
+
+    return redirect(url_for("show_series", series_id=series_id))
+
+
+@app.route('/shows/series/<int:series_id>/delete', methods=['GET'])
+def delete_series(series_id):
+    # cancels the series: its upcoming shows are deleted, past ones are kept
+    series = ShowSeries.query.get_or_404(series_id)
+    try:
+        venue_id, artist_id = series.venue_id, series.artist_id
+        now = request_now()
+        Show.query.filter(Show.series_id == series_id, Show.start_time > now) \
+            .delete(synchronize_session=False)
+        db.session.delete(series)
+        Venue.refresh_show_counters(now, [venue_id])
+        Artist.refresh_show_counters(now, [artist_id])
+        db.session.commit()
+        page_cache.invalidate('shows', 'venues', f'venue:{venue_id}', f'artist:{artist_id}')
+        flash('Series was cancelled successfully!')
+    except Exception:
+        db.session.rollback()
+        print(sys.exc_info())
+        flash('Series was not cancelled successfully.')
+    finally:
+        db.session.close()
+
+    return redirect(url_for("index"))
+
+
+#  Images
+#  ----------------------------------------------------------------
+
+@app.template_global()
+def thumbnail_url(kind, id, image_link, size):
+    # proxied thumbnail of a venue's or artist's image link, or nothing without one
+    if not image_link:
+        return ""
+    return url_for("image", kind=kind, id=id, size=size)
+
+
+@app.route('/images/<any(venues, artists):kind>/<int:id>/<any(small, medium, large):size>')
+@db.router.reads
+def image(kind, id, size):
+    # The image link of a venue or artist scaled down to a thumbnail. Thumbnails are
+    # kept in the disk cache and named by their link, so a changed link gets a new ETag.
+    model = Venue if kind == "venues" else Artist
+    image_link = db.session.query(model.image_link).filter(model.id == id).scalar()
+    if not image_link:
+        abort(404)
+
+    key = sha256(f"{image_link}|{size}".encode("utf-8")).hexdigest()
+    etag = key[:32]
+    if not is_resource_modified(request.environ, etag=etag):
+        response = Response(status=304)
+    else:
+        data = image_cache.get(key)
+        if data is None:
+            try:
+                data = thumbnail(image_origin.fetch(image_link), THUMBNAIL_SIZES[size])
+            except NotAnImage as error:
+                app.logger.warning(f"image {kind}/{id}: {error}")
+                abort(404)
+            except OriginError as error:
+                app.logger.warning(f"image {kind}/{id}: {error}")
+                abort(502)
+            image_cache.set(key, data)
+        response = Response(data, mimetype=image_mimetype(data))
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config["IMAGE_MAX_AGE"]
+    return response
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+def genre_list_column(model, genre_column):
+    # comma separated genre names of the row in alphabetical order, as a correlated subquery
+    genres = genre_column.table.join(Genre, Genre.id == genre_column.table.c.genre_id)
+    if db.engine.dialect.name == "postgresql":
+        aggregate = db.func.string_agg(Genre.name, aggregate_order_by(db.literal_column("','"), Genre.name))
+        return db.select([aggregate]).select_from(genres).where(genre_column == model.id).as_scalar()
+    # group_concat has no ORDER BY (before SQLite 3.44); it keeps the order of a subquery
+    names = db.select([Genre.name]).select_from(genres).where(genre_column == model.id) \
+        .order_by(Genre.name).correlate(model).alias()
+    return db.select([db.func.group_concat(names.c.name, ",")]).as_scalar()
+
+
+def export_query(kind, city=None, state=None, date_from=None, date_to=None):
+    if kind == "shows":
+        query = db.session.query(
+            Show.id, Show.artist_id, Show.venue_id, Show.start_time, Show.end_time, Venue.city, Venue.state
+        ).join(Venue, Venue.id == Show.venue_id)
+        place = Venue
+        if date_from:
+            query = query.filter(Show.start_time >= date_from)
+        if date_to:
+            query = query.filter(Show.start_time < date_to + timedelta(days=1))
+        query = query.order_by(Show.id)
+    else:
+        place, genre_column = (Venue, venue_genres.c.venue_id) if kind == "venues" else (Artist, artist_genres.c.artist_id)
+        columns = [column for column in place.__table__.columns if column.name != "upcoming_shows_counter"]
+        query = db.session.query(*columns, genre_list_column(place, genre_column).label("genres")).order_by(place.id)
+    if city:
+        query = query.filter(place.city == city)
+    if state:
+        query = query.filter(place.state == state)
+    return query
+
+
+def export_lines(query, format):
+    # CSV or JSON Lines text, one row at a time; yield_per streams rows from a server
+    # side cursor so memory use stays flat however large the table is
+    names = [column["name"] for column in query.column_descriptions]
+    buffer = io.StringIO()
+    if format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        write = writer.writerow
+    else:
+        write = lambda row: buffer.write(
+            json.dumps(dict(zip(names, row)), separators=(",", ":"), default=api_json_default) + "\n"
+        )
+
+    for row in query.yield_per(1000):
+        write(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@app.route('/export/<any(venues, artists, shows):kind>.<any(csv, jsonl):format>')
+@db.router.reads
+def export(kind, format):
+    token = app.config["EXPORT_TOKEN"]
+    supplied = request.headers.get("Authorization", "")
+    if not token or not hmac.compare_digest(supplied, f"Bearer {token}"):
+        return Response("Export requires a valid token.", 401, {"WWW-Authenticate": "Bearer"})
+    try:
+        date_from = parse_date_arg("from")
+        date_to = parse_date_arg("to")
+    except ValueError:
+        abort(400)
+
+    query = export_query(kind, request.args.get("city"), request.args.get("state"), date_from, date_to)
+    return Response(
+        stream_with_context(export_lines(query, format)),
+        mimetype="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={kind}.{format}"}
+    )
+
+
+#----------------------------------------------------------------------------#
+# API.
+#----------------------------------------------------------------------------#
+
+# Responses are built straight from selected column tuples; ?fields= picks which
+# columns are queried and returned.
+
+def venue_api_columns(now):
+    return {
+        "id": Venue.id,
+        "name": Venue.name,
+        "city": Venue.city,
+        "state": Venue.state,
+        "address": Venue.address,
+        "phone": Venue.phone,
+        "website": Venue.website,
+        "image_link": Venue.image_link,
+        "facebook_link": Venue.facebook_link,
+        "seeking_talent": Venue.seeking_talent,
+        "seeking_description": Venue.seeking_description,
+        "timezone": Venue.timezone,
+        "num_upcoming_shows": Venue.upcoming_shows_count_column(now),
+    }
+
+
+def artist_api_columns(now):
+    return {
+        "id": Artist.id,
+        "name": Artist.name,
+        "city": Artist.city,
+        "state": Artist.state,
+        "phone": Artist.phone,
+        "website": Artist.website,
+        "image_link": Artist.image_link,
+        "facebook_link": Artist.facebook_link,
+        "seeking_venue": Artist.seeking_venue,
+        "seeking_description": Artist.seeking_description,
+        "num_upcoming_shows": Artist.upcoming_shows_count_column(now),
+    }
+
+
+SHOW_API_FIELDS = ("id", "start_time", "end_time", "venue_id", "venue_name", "artist_id", "artist_name", "artist_image_link")
+
+
+def api_json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def api_response(payload, status=200):
+    body = json.dumps(payload, separators=(",", ":"), default=api_json_default)
+    return Response(body, status=status, mimetype="application/json")
+
+
+def api_error(status, message):
+    abort(api_response({"error": message}, status))
+
+
+def api_fields(available):
+    requested = request.args.get("fields")
+    if not requested:
+        return list(available)
+    fields = [field.strip() for field in requested.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        api_error(400, "unknown fields: " + ",".join(unknown))
+    return fields
+
+
+def api_limit():
+    limit = request.args.get("limit", app.config["API_PAGE_SIZE"], type=int)
+    return max(1, min(limit, app.config["API_MAX_PAGE_SIZE"]))
+
+
+def api_collection(model, columns):
+    # one keyset page ordered by id; "next" is the ?after= value of the following page
+    fields = api_fields(columns)
+    limit = api_limit()
+    query = db.session.query(model.id, *(columns[field] for field in fields))
+    after = request.args.get("after", type=int)
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows = query.order_by(model.id).limit(limit + 1).all()
+
+    return api_response({
+        "data": [dict(zip(fields, row[1:])) for row in rows[:limit]],
+        "next": rows[limit - 1][0] if len(rows) > limit else None
+    })
+
+
+def api_detail(model, api_columns, genre_column, id):
+    now = request_now()
+    columns = dict(
+        api_columns(now),
+        past_shows_count=model.num_past_shows(now),
+        upcoming_shows_count=model.num_upcoming_shows(now)
+    )
+    fields = api_fields(list(columns) + ["genres", "past_shows", "upcoming_shows"])
+    selected = [field for field in fields if field in columns]
+
+    data = {}
+    if selected:
+        row = db.session.query(*(columns[field] for field in selected)).filter(model.id == id).first()
+        if row is None:
+            api_error(404, "not found")
+        data.update(zip(selected, row))
+    elif not db.session.query(model.query.filter(model.id == id).exists()).scalar():
+        api_error(404, "not found")
+
+    if "genres" in fields:
+        data["genres"] = [name for name, in db.session.query(Genre.name)
+                          .join(genre_column.table, genre_column.table.c.genre_id == Genre.id)
+                          .filter(genre_column == id).order_by(Genre.name)]
+    limit = app.config["DETAIL_PAGE_SHOWS"]
+    for field, upcoming in (("past_shows", False), ("upcoming_shows", True)):
+        if field in fields:
+            data[field] = [row._asdict() for row in model.shows_query(id, now, upcoming, limit)]
+    return api_response(data)
+
+
+def api_search(model, api_columns, fallback_index):
+    term = request.args.get("q", "")
+    page = max(1, request.args.get("page", 1, type=int))
+    columns = api_columns(request_now())
+    fields = api_fields(columns)
+
+    count, ids = search_catalog(model, fallback_index, term, page)
+    rows = db.session.query(model.id, *(columns[field] for field in fields)).filter(model.id.in_(ids)).all()
+    rows.sort(key=lambda row: ids.index(row[0])) # keep search ranking
+    return api_response({"count": count, "page": page, "data": [dict(zip(fields, row[1:])) for row in rows]})
+
+
+@app.route('/api/v1/venues')
+@db.router.reads
+def api_venues():
+    return api_collection(Venue, venue_api_columns(request_now()))
+
+
+@app.route('/api/v1/venues/<int:venue_id>')
+@db.router.reads
+def api_venue(venue_id):
+    return api_detail(Venue, venue_api_columns, venue_genres.c.venue_id, venue_id)
+
+
+@app.route('/api/v1/venues/search')
+@db.router.reads
+def api_search_venues():
+    return api_search(Venue, venue_api_columns, venue_search_index)
+
+
+@app.route('/api/v1/artists')
+@db.router.reads
+def api_artists():
+    return api_collection(Artist, artist_api_columns(request_now()))
+
+
+@app.route('/api/v1/artists/<int:artist_id>')
+@db.router.reads
+def api_artist(artist_id):
+    return api_detail(Artist, artist_api_columns, artist_genres.c.artist_id, artist_id)
+
+
+@app.route('/api/v1/artists/search')
+@db.router.reads
+def api_search_artists():
+    return api_search(Artist, artist_api_columns, artist_search_index)
+
+
+@app.route('/api/v1/shows')
+@db.router.reads
+def api_shows():
+    fields = api_fields(SHOW_API_FIELDS)
+    limit = api_limit()
+    # only the requested columns and the joins they need, plus the cursor's
+    selected = ["id", "start_time"] + [field for field in fields if field not in ("id", "start_time")]
+    rows = shows_listing_query(selected).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_show_cursor(rows[limit - 1].start_time, rows[limit - 1].id)
+    return api_response({
+        "data": [{field: getattr(row, field) for field in fields} for row in rows[:limit]],
+        "next": next_cursor
+    })
+
+
+@app.after_request
+def compress_api_response(response):
+    # brotli when the client accepts it and the module is installed, gzip otherwise
+    if not request.path.startswith("/api/") or response.direct_passthrough or \
+            response.status_code != 200 or "Content-Encoding" in response.headers:
+        return response
+    body = response.get_data()
+    if len(body) < app.config["API_COMPRESS_MIN_SIZE"]:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and "br" in accepted:
+        response.set_data(brotli.compress(body))
+        response.headers["Content-Encoding"] = "br"
+    elif "gzip" in accepted:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        return response
+    response.vary.add("Accept-Encoding")
+    return response
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -595,6 +1727,616 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+@app.errorhandler(OperationalError)
+def database_unavailable(error):
+    # the database is down or failing over; ask clients to back off instead of retrying at once
+    db.session.rollback()
+    app.logger.error(f"database unavailable: {error}")
+    response = make_response(render_template('errors/500.html'), 503)
+    response.headers["Retry-After"] = "5"
+    return response
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@app.cli.command("refresh-show-counters")
+def refresh_show_counters_command():
+    # roll the stored upcoming show counters forward as shows move into the past;
+    # run periodically (e.g. from cron) when SHOW_COUNTERS is on
+    now = utc_now()
+    Venue.refresh_show_counters(now)
+    Artist.refresh_show_counters(now)
+    db.session.commit()
+    print("Upcoming show counters refreshed.")
+
+
+def read_import_rows(path):
+    # stream (row number, row) pairs from a .csv or JSON Lines file; a JSON line that
+    # doesn't parse is passed on as the ValueError so it gets reported like a bad row
+    with open(path, newline="") as file:
+        if path.endswith(".csv"):
+            yield from enumerate(csv.DictReader(file), 1)
+            return
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as error:
+                yield number, error
+
+
+IMPORT_BOOLEAN_COLUMNS = {"seeking_talent", "seeking_venue"}
+IMPORT_TRUE_VALUES = {"true", "t", "yes", "y", "1", "on"}
+IMPORT_FALSE_VALUES = {"false", "f", "no", "n", "0", "off", ""}
+
+
+def import_form_data(row):
+    # form data for one import row; genres may be a list or a comma separated string,
+    # booleans JSON booleans or CSV text like true/false, yes/no or 1/0. Raises
+    # ValueError for a boolean it doesn't recognise.
+    data = MultiDict()
+    for key, value in row.items():
+        if key == "genres" and isinstance(value, str):
+            value = [genre.strip() for genre in value.split(",") if genre.strip()]
+        if key in IMPORT_BOOLEAN_COLUMNS and isinstance(value, (str, int)) and not isinstance(value, bool):
+            text = str(value).strip().lower()
+            if text not in IMPORT_TRUE_VALUES | IMPORT_FALSE_VALUES:
+                raise ValueError(f"{key}: not a boolean: {value!r}")
+            value = text in IMPORT_TRUE_VALUES
+        if isinstance(value, list):
+            for item in value:
+                data.add(key, item)
+        elif isinstance(value, bool):
+            if value: # an absent BooleanField is False
+                data.add(key, "y")
+        elif value is not None:
+            data.add(key, str(value))
+    return data
+
+
+def insert_catalog_chunk(model, genre_column, rows):
+    # rows are (column values, genre names) of validated venues or artists
+    table = model.__table__
+    now = datetime.utcnow()
+    values = [dict(columns, created_at=now, updated_at=now) for columns, _ in rows]
+    if db.engine.dialect.name == "postgresql":
+        ids = [id for id, in db.session.execute(table.insert().values(values).returning(table.c.id))]
+    else:
+        ids = [db.session.execute(table.insert(), value).inserted_primary_key[0] for value in values]
+
+    genres = {genre.name: genre for genre in Genre.from_names(sorted({name for _, names in rows for name in names}))}
+    db.session.add_all(genres.values())
+    db.session.flush() # assign ids to new genres
+    associations = [
+        {genre_column.name: id, "genre_id": genres[name].id}
+        for id, (_, names) in zip(ids, rows) for name in names
+    ]
+    if associations:
+        db.session.execute(genre_column.table.insert().values(associations))
+
+
+def insert_show_chunk(rows):
+    now = datetime.utcnow()
+    if db.engine.dialect.name == "postgresql":
+        # COPY is several times faster than even a multi-row INSERT
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                row["artist_id"], row["venue_id"], row["start_time"].isoformat(), row["end_time"].isoformat(),
+                now.isoformat()
+            ])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(
+            'COPY "Show" (artist_id, venue_id, start_time, end_time, updated_at) FROM STDIN WITH (FORMAT csv)', buffer
+        )
+    else:
+        db.session.execute(Show.__table__.insert().values([dict(row, updated_at=now) for row in rows]))
+
+
+def missing_show_references(rows):
+    # row positions whose artist or venue doesn't exist, checked with one query per table
+    artist_ids = {row["artist_id"] for row in rows}
+    venue_ids = {row["venue_id"] for row in rows}
+    artist_ids -= {id for id, in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+    venue_ids -= {id for id, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+    return {
+        position: "unknown artist or venue" for position, row in enumerate(rows)
+        if row["artist_id"] in artist_ids or row["venue_id"] in venue_ids
+    }
+
+
+def import_chunk(kind, chunk):
+    # validate and insert one chunk of (row number, form data) in a single transaction;
+    # returns (number of rows inserted, [(row number, errors)])
+    form_class = {"venues": VenueForm, "artists": ArtistForm, "shows": ShowForm}[kind]
+    valid, numbers, errors = [], [], []
+    with app.test_request_context():
+        for number, data in chunk:
+            form = form_class(formdata=data, meta={"csrf": False})
+            if form.validate():
+                valid.append(form.data)
+                numbers.append(number)
+            else:
+                errors.append((number, form.errors))
+
+    if kind == "shows":
+        checked = []
+        for number, row in zip(numbers, valid):
+            try:
+                row["artist_id"], row["venue_id"] = int(row["artist_id"]), int(row["venue_id"])
+                checked.append((number, row))
+            except ValueError:
+                errors.append((number, "artist_id and venue_id must be integers"))
+        missing = missing_show_references([row for _, row in checked])
+        errors.extend((checked[position][0], error) for position, error in missing.items())
+        checked = [item for position, item in enumerate(checked) if position not in missing]
+
+        # check rows against existing shows and each other, in file order
+        numbers, valid = [], []
+        timezones = venue_timezones({row["venue_id"] for _, row in checked})
+        for _, row in checked:
+            row["start_time"] = to_utc(row["start_time"], timezones[row["venue_id"]])
+            row["end_time"] = row["start_time"] + timedelta(minutes=row.pop("duration"))
+        calendars = show_calendars([row for _, row in checked]) if checked else {}
+        for number, row in checked:
+            keys = (("venue", row["venue_id"]), ("artist", row["artist_id"]))
+            if any(calendars[key].conflict(row["start_time"], row["end_time"]) for key in keys):
+                errors.append((number, "overlaps another show of the venue or artist"))
+                continue
+            for key in keys:
+                calendars[key].add(row["start_time"], row["end_time"])
+            numbers.append(number)
+            valid.append(row)
+    else:
+        valid = [
+            ({key: value for key, value in row.items() if key != "genres"}, row["genres"])
+            for row in valid
+        ]
+
+    if not valid:
+        return 0, errors
+    try:
+        if kind == "shows":
+            insert_show_chunk(valid)
+        elif kind == "venues":
+            insert_catalog_chunk(Venue, venue_genres.c.venue_id, valid)
+        else:
+            insert_catalog_chunk(Artist, artist_genres.c.artist_id, valid)
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()
+        return 0, errors + [(f"{numbers[0]}-{numbers[-1]}", f"chunk not imported: {error}")]
+    return len(valid), errors
+
+
+@app.cli.command("import")
+@click.argument("kind", type=click.Choice(["venues", "artists", "shows"]))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", default=1000, show_default=True, help="Rows validated and committed together.")
+def import_command(kind, path, chunk_size):
+    # Bulk import venues, artists or shows from a .csv or .jsonl file. Rows are checked
+    # with the same rules as the create forms and written in chunked transactions using
+    # multi-row INSERTs (COPY for shows on PostgreSQL).
+    started = time.monotonic()
+    imported = failed = 0
+
+    def flush(chunk):
+        nonlocal imported, failed
+        count, errors = import_chunk(kind, chunk)
+        imported += count
+        failed += len(errors)
+        for number, error in errors:
+            print(f"row {number}: {error}", file=sys.stderr)
+        print(f"{imported} rows imported ({imported / (time.monotonic() - started):.0f} rows/s)")
+
+    chunk = []
+    for number, row in read_import_rows(path):
+        if isinstance(row, Exception):
+            failed += 1
+            print(f"row {number}: {row}", file=sys.stderr)
+            continue
+        try:
+            chunk.append((number, import_form_data(row)))
+        except ValueError as error:
+            failed += 1
+            print(f"row {number}: {error}", file=sys.stderr)
+            continue
+        if len(chunk) == chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    if kind == "shows":
+        now = utc_now()
+        Venue.refresh_show_counters(now)
+        Artist.refresh_show_counters(now)
+        db.session.commit()
+    venue_search_index.invalidate()
+    artist_search_index.invalidate()
+    page_cache.invalidate("venues", "artists", "shows")
+
+    print(f"Done: {imported} imported, {failed} failed in {time.monotonic() - started:.1f}s.")
+    if failed:
+        sys.exit(1)
+
+
+@app.cli.command("export")
+@click.argument("kind", type=click.Choice(["venues", "artists", "shows"]))
+@click.option("--format", "format", type=click.Choice(["csv", "jsonl"]), default="csv", show_default=True)
+@click.option("--output", type=click.File("w"), default="-", help="File to write, stdout by default.")
+@click.option("--city")
+@click.option("--state")
+@click.option("--from", "date_from", type=click.DateTime(["%Y-%m-%d"]), help="Shows on or after this date.")
+@click.option("--to", "date_to", type=click.DateTime(["%Y-%m-%d"]), help="Shows on or before this date.")
+def export_command(kind, format, output, city, state, date_from, date_to):
+    # Stream a CSV or JSON Lines dump of venues, artists or shows in constant memory.
+    # Dates are days in UTC.
+    date_from, date_to = (date and pytz.utc.localize(date) for date in (date_from, date_to))
+    for line in export_lines(export_query(kind, city, state, date_from, date_to), format):
+        output.write(line)
+
+
+@app.cli.command("materialize-series")
+def materialize_series_command():
+    # Insert the next occurrences of every show series up to SERIES_HORIZON_DAYS ahead.
+    # Run periodically (e.g. daily from cron) so far-future shows appear as they near.
+    horizon = series_horizon()
+    # materialized_until is in each venue's time; compared in UTC a series can come up
+    # before it has anything new, which materialize_series handles
+    for series in ShowSeries.query.filter(
+            ShowSeries.materialized_until < horizon.replace(tzinfo=None) + timedelta(days=1)).all():
+        inserted, conflicting = materialize_series(series, horizon)
+        for start_time in conflicting:
+            print(f"series {series.id}: skipped {start_time:%m/%d/%Y %H:%M}, overlaps another show", file=sys.stderr)
+        if inserted:
+            now = utc_now()
+            Venue.refresh_show_counters(now, [series.venue_id])
+            Artist.refresh_show_counters(now, [series.artist_id])
+            page_cache.invalidate(f'venue:{series.venue_id}', f'artist:{series.artist_id}')
+        db.session.commit()
+    page_cache.invalidate('shows', 'venues')
+    print("Show series materialized.")
+
+
+@app.cli.command("compile-templates")
+def compile_templates():
+    # Compile every template into the bytecode cache, e.g. at deploy time, so workers
+    # starting afterwards skip parsing and compiling them.
+    if app.jinja_env.bytecode_cache is None:
+        raise click.ClickException("TEMPLATE_BYTECODE_CACHE_DIR is not set.")
+    started = time.perf_counter()
+    names = app.jinja_env.list_templates(extensions=["html"])
+    for name in names:
+        app.jinja_env.get_template(name)
+    print(f"Compiled {len(names)} templates in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+
+def template_benchmark_contexts():
+    # sample pages for "flask bench-templates", sized like the real ones
+    start_time = datetime(2035, 5, 21, 21, 30, tzinfo=pytz.utc)
+    genres = [{"name": name} for name in ("Jazz", "Reggae", "Swing")]
+    venue_shows = [{"artist_id": i, "artist_name": f"Artist {i}", "artist_image_link": "https://example.com/a.jpg",
+                    "start_time": start_time} for i in range(app.config["DETAIL_PAGE_SHOWS"])]
+    artist_shows = [{"venue_id": i, "venue_name": f"Venue {i}", "venue_image_link": "https://example.com/v.jpg",
+                     "venue_timezone": "America/New_York", "start_time": start_time} for i in range(app.config["DETAIL_PAGE_SHOWS"])]
+    listed = [{"id": i, "name": f"Name {i}", "num_upcoming_shows": i % 4} for i in range(app.config["SEARCH_RESULTS_PER_PAGE"])]
+    profile = {"id": 1, "name": "The Musical Hop", "genres": genres, "city": "San Francisco", "state": "CA",
+               "address": "1015 Folsom Street", "phone": "123-123-1234", "website": "https://example.com",
+               "facebook_link": "https://www.facebook.com/example", "seeking_talent": True, "seeking_venue": True,
+               "seeking_description": "Looking for shows to perform at.", "image_link": "https://example.com/i.jpg",
+               "timezone": "America/Los_Angeles"}
+    page_shows = [{**venue_show, **artist_show} for venue_show, artist_show in zip(venue_shows, artist_shows)]
+    return {
+        "pages/home.html": {"venues": listed[:10], "artists": listed[:10]},
+        "pages/venues.html": {"areas": [{"city": f"City {i}", "state": "CA", "venues": listed[:5]} for i in range(10)]},
+        "pages/artists.html": {"artists": listed},
+        "pages/show_venue.html": {"venue": {**profile, "upcoming_shows": venue_shows, "past_shows": venue_shows,
+                                            "upcoming_shows_count": len(venue_shows), "past_shows_count": len(venue_shows)}},
+        "pages/show_artist.html": {"artist": {**profile, "upcoming_shows": artist_shows, "past_shows": artist_shows,
+                                              "upcoming_shows_count": len(artist_shows), "past_shows_count": len(artist_shows)}},
+        "pages/search_venues.html": {"results": {"count": 100, "data": listed}, "search_term": "a", "page": 2, "has_next": True},
+        "pages/search_artists.html": {"results": {"count": 100, "data": listed}, "search_term": "a", "page": 2, "has_next": True},
+        "pages/shows.html": {"shows": page_shows, "filters": {}},
+    }
+
+
+@app.cli.command("bench-templates")
+@click.option("--iterations", default=200, show_default=True)
+def bench_templates(iterations):
+    # Cost of the page templates: compiling from source, loading cold (from the bytecode
+    # cache when configured), and rendering with sample data once loaded.
+    cold_env = app.jinja_env.overlay(cache_size=0)
+    print(f"{'template':<28}{'compile ms':>12}{'cold load ms':>14}{'render ms':>11}")
+    with app.test_request_context():
+        for name, context in template_benchmark_contexts().items():
+            source, filename, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+            started = time.perf_counter()
+            app.jinja_env.compile(source, name, filename)
+            compile_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            cold_env.get_template(name)
+            load_time = time.perf_counter() - started
+
+            render_template(name, **context)  # warm up
+            started = time.perf_counter()
+            for _ in range(iterations):
+                render_template(name, **context)
+            render_time = (time.perf_counter() - started) / iterations
+
+            print(f"{name:<28}{compile_time * 1000:>12.2f}{load_time * 1000:>14.2f}{render_time * 1000:>11.3f}")
+
+
+@app.cli.command("bench-date-format")
+@click.option("--shows", default=5000, show_default=True)
+def bench_date_format(shows):
+    # Formatting the start times of a page of shows: as the views did, parsing the
+    # strftime strings back and building the Babel format on every call, against
+    # formatting datetimes with the cached formatter.
+    start_times = [datetime(2035, 5, 21, 21, 30) + timedelta(hours=i) for i in range(shows)]
+    strings = [start_time.strftime("%m/%d/%Y, %H:%M:%S") for start_time in start_times]
+    pattern = DATETIME_FORMATS['full']
+
+    with app.app_context():
+        started = time.perf_counter()
+        for value in strings:
+            babel.dates.format_datetime(dateutil.parser.parse(value), pattern)
+        parsing = time.perf_counter() - started
+
+        format_datetime(start_times[0], 'full')  # warm up
+        started = time.perf_counter()
+        for value in start_times:
+            format_datetime(value, 'full')
+        cached = time.perf_counter() - started
+
+    print(f"parse + format: {parsing * 1000:8.1f} ms")
+    print(f"cached format:  {cached * 1000:8.1f} ms ({parsing / cached:.1f}x faster)")
+
+
+def profile_page(client, path, *tags):
+    # (RequestProfile, seconds) of rendering path afresh: in its own app context, like
+    # a served request, and with the page cache entries depending on tags invalidated
+    page_cache.invalidate("venues", "artists", "shows", *tags)
+    with app.app_context(), recorded_queries() as profile:
+        started = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise click.ClickException(f"GET {path} answered {response.status_code}")
+    return profile, elapsed
+
+
+def insert_bench_venues(count, areas):
+    # count venues spread over areas cities, each with an upcoming and a past show of
+    # one artist, committed so the pages requested see them; returns the artist id
+    now, updated_at = utc_now(), datetime.utcnow()
+    artist = Artist(name="Bench Artist", city="Bench City 0", state="CA")
+    db.session.add(artist)
+    db.session.flush()
+    venues = [Venue(name=f"Bench Venue {i}", city=f"Bench City {i % areas}", state="CA", address=f"{i} Bench Street")
+              for i in range(count)]
+    db.session.add_all(venues)
+    db.session.flush()
+    shows = []
+    for i, venue in enumerate(venues):
+        for start_time in (now + timedelta(hours=2 * i + 1), now - timedelta(hours=2 * i + 2)):
+            shows.append({"artist_id": artist.id, "venue_id": venue.id, "start_time": start_time,
+                          "end_time": start_time + timedelta(hours=1), "updated_at": updated_at})
+    db.session.execute(Show.__table__.insert().values(shows))
+    Venue.refresh_show_counters(now, [venue.id for venue in venues])
+    Artist.refresh_show_counters(now, [artist.id])
+    db.session.commit()
+    venue_search_index.invalidate()
+    artist_search_index.invalidate()
+    return artist.id
+
+
+def insert_bench_shows(count):
+    # a venue and an artist with count upcoming and count past shows together,
+    # committed; returns (venue id, artist id)
+    now, updated_at = utc_now(), datetime.utcnow()
+    venue = Venue(name="Bench Venue", city="Bench City", state="CA", address="1 Bench Street")
+    artist = Artist(name="Bench Artist", city="Bench City", state="CA")
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    shows = []
+    for i in range(count):
+        for start_time in (now + timedelta(hours=2 * i + 1), now - timedelta(hours=2 * i + 2)):
+            shows.append({"artist_id": artist.id, "venue_id": venue.id, "start_time": start_time,
+                          "end_time": start_time + timedelta(hours=1), "updated_at": updated_at})
+    db.session.execute(Show.__table__.insert().values(shows))
+    Venue.refresh_show_counters(now, [venue.id])
+    Artist.refresh_show_counters(now, [artist.id])
+    db.session.commit()
+    venue_search_index.invalidate()
+    artist_search_index.invalidate()
+    return venue.id, artist.id
+
+
+def delete_bench_rows(artist_id):
+    # the rows added by insert_bench_venues or insert_bench_shows
+    venue_ids = [id for id, in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+    Show.query.filter(Show.artist_id == artist_id).delete(synchronize_session=False)
+    Venue.query.filter(Venue.id.in_(venue_ids)).delete(synchronize_session=False)
+    Artist.query.filter(Artist.id == artist_id).delete(synchronize_session=False)
+    db.session.commit()
+    venue_search_index.invalidate()
+    artist_search_index.invalidate()
+
+
+@app.cli.command("bench-venues")
+@click.option("--venues", default=100, show_default=True, help="Venues added for the first run, ten times as many for the second.")
+def bench_venues(venues):
+    # Renders /venues with N and then 10 x N added venues and fails unless both take the
+    # same number of queries: the page must not issue a query per area or venue.
+    # The venues are committed and deleted afterwards, so run it against a development
+    # or test database.
+    client = app.test_client()
+    counts = []
+    for count in (venues, venues * 10):
+        artist_id = insert_bench_venues(count, max(1, count // 10))
+        try:
+            profile, elapsed = profile_page(client, "/venues")
+        finally:
+            delete_bench_rows(artist_id)
+        counts.append(profile.count)
+        print(f"{count:>7} venues: {profile.count} queries, {elapsed * 1000:.1f} ms")
+    if counts[0] != counts[1]:
+        raise click.ClickException("the query count of /venues grows with the number of venues")
+
+
+@app.cli.command("bench-show-counts")
+@click.option("--shows", default=100, show_default=True, help="Upcoming and past shows for the first run, ten times as many for the second.")
+def bench_show_counts(shows):
+    # Renders the venue and artist pages and searches of a venue and an artist sharing
+    # N and then 10 x N upcoming and past shows, and fails unless both take the same
+    # number of queries. Also times counting a venue's upcoming and past shows in SQL
+    # against the previous code path, loading every show and partitioning them in
+    # Python. Sample rows are committed and deleted afterwards, as for bench-venues.
+    client = app.test_client()
+    counts = []
+    for count in (shows, shows * 10):
+        venue_id, artist_id = insert_bench_shows(count)
+        try:
+            paths = {
+                f"/venues/{venue_id}": (f"venue:{venue_id}",),
+                f"/artists/{artist_id}": (f"artist:{artist_id}",),
+                "/venues/search?search_term=Bench+Venue": (),
+                "/artists/search?search_term=Bench+Artist": (),
+            }
+            run = {}
+            for path, tags in paths.items():
+                profile, elapsed = profile_page(client, path, *tags)
+                run[path] = profile.count
+                print(f"{count:>7} shows {path}: {profile.count} queries, {elapsed * 1000:.1f} ms")
+            counts.append(run)
+
+            started = time.perf_counter()
+            venue = Venue.query.options(db.selectinload(Venue.shows)).get(venue_id)
+            upcoming = [show for show in venue.shows if show.start_time > utc_now()]
+            past = [show for show in venue.shows if show.start_time <= utc_now()]
+            python_time = time.perf_counter() - started
+            db.session.rollback()
+
+            started = time.perf_counter()
+            now = utc_now()
+            db.session.query(Venue.num_past_shows(now), Venue.num_upcoming_shows(now)) \
+                .filter(Venue.id == venue_id).one()
+            sql_time = time.perf_counter() - started
+            db.session.rollback()
+            print(f"{count:>7} shows counted: in Python {python_time * 1000:.1f} ms "
+                  f"({len(upcoming)} upcoming, {len(past)} past), in SQL {sql_time * 1000:.1f} ms")
+        finally:
+            delete_bench_rows(artist_id)
+    grown = [path for path in counts[0] if counts[0][path] != counts[1][path]]
+    if grown:
+        raise click.ClickException(f"the query count grows with the number of shows: {', '.join(grown)}")
+
+
+@app.cli.command("check-queries")
+@click.option("--venues", default=50, show_default=True, help="Sample venues added, each with two shows.")
+def check_queries(venues):
+    # Renders the list, search and detail pages and the API lists over sample rows and
+    # fails when one repeats a statement more than SQL_PROFILER_DUPLICATE_THRESHOLD
+    # times, the mark of an N+1 query. Sample rows are committed and deleted afterwards,
+    # as for bench-venues.
+    threshold = app.config["SQL_PROFILER_DUPLICATE_THRESHOLD"]
+    client = app.test_client()
+    artist_id = insert_bench_venues(venues, max(1, venues // 10))
+    failed = []
+    try:
+        venue_id = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).limit(1).scalar()
+        db.session.rollback()
+        paths = {
+            "/": (),
+            "/venues": (),
+            "/artists": (),
+            "/shows": (),
+            "/venues/search?search_term=Bench": (),
+            "/artists/search?search_term=Bench": (),
+            f"/venues/{venue_id}": (f"venue:{venue_id}",),
+            f"/artists/{artist_id}": (f"artist:{artist_id}",),
+            "/api/v1/venues": (),
+            "/api/v1/artists": (),
+            "/api/v1/shows": (),
+        }
+        for path, tags in paths.items():
+            profile, _ = profile_page(client, path, *tags)
+            duplicates = profile.duplicates(threshold)
+            if duplicates:
+                failed.append(path)
+                print(f"{path}: {profile.count} queries, N+1 suspected")
+                for shape, count in duplicates:
+                    print(f"    {count} x {shape}")
+            else:
+                print(f"{path}: {profile.count} queries, ok")
+    finally:
+        delete_bench_rows(artist_id)
+
+    if failed:
+        sys.exit(1)
+
+
+@app.cli.command("build-assets")
+def build_assets():
+    # Bundle, minify and fingerprint the CSS and JS into static/dist/; run at deploy time.
+    for bundle, filename in assets.build().items():
+        print(f"{bundle} -> dist/{filename}")
+
+
+@app.cli.command("check-indexes")
+def check_indexes_command():
+    # EXPLAIN the hot views' queries, built by the same functions the views use, with
+    # sequential scans disabled; a "Seq Scan" still in a plan means no index can serve
+    # that query. Exits non-zero so CI can gate on it.
+    now = utc_now()
+    limit = app.config["DETAIL_PAGE_SHOWS"]
+    per_page = app.config["SEARCH_RESULTS_PER_PAGE"]
+    venue_search, venue_ranked = search_queries(Venue, "musical hop")
+    artist_search, artist_ranked = search_queries(Artist, "guns")
+    queries = {
+        "index: recent venues": db.session.query(Venue.id, Venue.name).order_by(db.desc(Venue.created_at)).limit(10),
+        "index: recent artists": db.session.query(Artist.id, Artist.name).order_by(db.desc(Artist.created_at)).limit(10),
+        "venues: areas": venue_areas_query(now),
+        "venues: areas by genre": venue_areas_query(now, "Jazz"),
+        "show_venue: upcoming shows": Venue.shows_query(0, now, True, limit),
+        "show_venue: past shows": Venue.shows_query(0, now, False, limit),
+        "show_artist: upcoming shows": Artist.shows_query(0, now, True, limit),
+        "show_artist: past shows": Artist.shows_query(0, now, False, limit),
+        "search_venues: count": venue_search,
+        "search_venues: page": venue_ranked.limit(per_page),
+        "search_artists: count": artist_search,
+        "search_artists: page": artist_ranked.limit(per_page),
+    }
+    for name, args in (("shows: page", {}),
+                       ("shows: next page", {"after": encode_show_cursor(now, 0)}),
+                       ("shows: date range", {"from": "2035-01-01", "to": "2035-01-31"})):
+        with app.test_request_context("/shows", query_string=args):
+            queries[name] = shows_listing_query().limit(app.config["SHOWS_PER_PAGE"] + 1)
+
+    connection = db.session.connection()
+    connection.execute("SET LOCAL enable_seqscan = off")
+    failed = []
+    for name, query in queries.items():
+        compiled = query.statement.compile(dialect=db.engine.dialect)
+        plan = "\n".join(row[0] for row in connection.execute("EXPLAIN " + str(compiled), compiled.params))
+        if "Seq Scan" in plan:
+            failed.append(name)
+            print(f"{name}: no usable index\n{plan}\n")
+        else:
+            print(f"{name}: ok")
+    db.session.rollback()
+
+    if failed:
+        sys.exit(1)
+
+
 if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
@@ -0,0 +1,145 @@
+import gzip
+import json
+import mimetypes
+import os
+import re
+from hashlib import md5
+
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# bundle name -> source files under static/, in the order they are concatenated
+BUNDLES = {
+    "app.css": [
+        "css/bootstrap.min.css",
+        "css/layout.main.css",
+        "css/main.css",
+        "css/main.responsive.css",
+        "css/main.quickfix.css",
+    ],
+    "head.js": [
+        "js/libs/modernizr-2.8.2.min.js",
+        "js/libs/moment.min.js",
+    ],
+    # deferred, runs after jQuery which is loaded from its CDN
+    "app.js": [
+        "js/script.js",
+        "js/libs/bootstrap-3.1.1.min.js",
+        "js/plugins.js",
+    ],
+}
+
+CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+CSS_SPACE_RE = re.compile(r"\s*([{};,>])\s*")
+
+
+def minify_css(source):
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+    source = CSS_COMMENT_RE.sub("", source)
+    source = CSS_SPACE_RE.sub(r"\1", source)
+    return re.sub(r"\s+", " ", source).replace(";}", "}").strip()
+
+
+def minify_js(source):
+    # without rjsmin scripts are only concatenated; most of them ship minified already
+    return rjsmin.jsmin(source) if rjsmin is not None else source
+
+
+class Assets:
+    # Bundled, minified static assets with content hashed names. "flask build-assets"
+    # writes the bundles to static/dist/ with gzip (and Brotli, when the brotli package
+    # is installed) variants next to them, and a manifest mapping bundle names to files.
+    # Their URLs never change content, so they are served cacheable forever.
+    #
+    # Without a manifest, as when developing, templates get the source files instead.
+
+    MAX_AGE = 365 * 24 * 60 * 60
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.dist_folder = os.path.join(app.static_folder, "dist")
+        self.manifest_path = os.path.join(self.dist_folder, "manifest.json")
+        self.manifest = self.load_manifest()
+        app.add_template_global(self.asset_urls)
+        app.add_url_rule(f"{app.static_url_path}/dist/<path:filename>", "dist_asset", self.send_asset)
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def asset_urls(self, bundle):
+        if self.manifest is not None:
+            return [url_for("dist_asset", filename=self.manifest[bundle])]
+        return [url_for("static", filename=source) for source in BUNDLES[bundle]]
+
+    def build(self):
+        # returns the manifest written
+        os.makedirs(self.dist_folder, exist_ok=True)
+        manifest = {}
+        for bundle, sources in BUNDLES.items():
+            parts = []
+            for source in sources:
+                with open(os.path.join(self.static_folder, source), encoding="utf-8") as file:
+                    parts.append(file.read())
+            stem, extension = os.path.splitext(bundle)
+            if extension == ".css":
+                content = minify_css("\n".join(parts))
+            else:
+                # a statement can't run on into the next file
+                content = ";\n".join(minify_js(part) for part in parts)
+            data = content.encode("utf-8")
+
+            filename = f"{stem}.{md5(data).hexdigest()[:12]}{extension}"
+            path = os.path.join(self.dist_folder, filename)
+            with open(path, "wb") as file:
+                file.write(data)
+            with open(path + ".gz", "wb") as file:
+                file.write(gzip.compress(data, compresslevel=9))
+            if brotli is not None:
+                with open(path + ".br", "wb") as file:
+                    file.write(brotli.compress(data))
+            manifest[bundle] = filename
+
+        with open(self.manifest_path, "w") as file:
+            json.dump(manifest, file, indent=2)
+        self.manifest = manifest
+        return manifest
+
+    def send_asset(self, filename):
+        # the precompressed variant the client accepts, if it was built
+        encoding, suffix = None, ""
+        for candidate, candidate_suffix in (("br", ".br"), ("gzip", ".gz")):
+            if candidate in request.accept_encodings and \
+                    os.path.isfile(os.path.join(self.dist_folder, filename + candidate_suffix)):
+                encoding, suffix = candidate, candidate_suffix
+                break
+
+        response = send_from_directory(
+            self.dist_folder, filename + suffix,
+            mimetype=mimetypes.guess_type(filename)[0], cache_timeout=self.MAX_AGE
+        )
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = f"public, max-age={self.MAX_AGE}, immutable"
+        return response
@@ -0,0 +1,109 @@
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import g, request, session
+
+
+class LRUCache:
+    # In-process cache backend: least recently used entries are evicted past
+    # max_entries and every entry expires after its timeout. get/set(ex=)/delete/incr
+    # follow the Redis command names, so a redis.Redis client can be used instead.
+
+    def __init__(self, max_entries=1024, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self.entries = OrderedDict()
+        self.counters = {}  # incr'd keys are never evicted, losing one would resurrect stale pages
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.counters:
+                return self.counters[key]
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ex=None):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + (ex or self.default_timeout))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+                self.counters.pop(key, None)
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class PageCache:
+    # Caches rendered pages. Each page depends on a few tags ("venues", "venue:3", ...);
+    # the tag versions are part of the cache key, so invalidate() bumping a tag's version
+    # makes every page depending on it miss without having to find and delete them.
+    # The ETag of pages behind conditional_page is part of the key too: it also changes
+    # when shows move from upcoming to past, which no write view invalidates.
+    #
+    # Tag versions live in the backend, so with an LRUCache they are per process: a
+    # write handled by one worker leaves the others serving their entries until they
+    # expire. Use a Redis backend to share pages and versions between processes.
+
+    def __init__(self, backend=None, timeout=300):
+        self.backend = backend if backend is not None else LRUCache(default_timeout=timeout)
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, tags):
+        versions = ",".join(f"{tag}@{int(self.backend.get('version:' + tag) or 0)}" for tag in tags)
+        return f"page:{request.full_path}|{versions}|{g.get('page_etag', '')}"
+
+    def cached(self, tags):
+        # tags(**view_args) returns the tags the page depends on
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**view_args):
+                # flashed messages are rendered into the page, so those pages are never shared
+                if request.method != "GET" or session.get("_flashes"):
+                    return view(**view_args)
+
+                key = self.key(tags(**view_args))
+                body = self.backend.get(key)
+                if body is not None:
+                    self.hits += 1
+                    return body.decode("utf-8") if isinstance(body, bytes) else body
+
+                self.misses += 1
+                rv = view(**view_args)
+                if isinstance(rv, str):
+                    self.backend.set(key, rv.encode("utf-8"), ex=self.timeout)
+                return rv
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr("version:" + tag)
+
+    def stats(self):
+        stats = {"hits": self.hits, "misses": self.misses}
+        if isinstance(self.backend, LRUCache):
+            stats["entries"] = len(self.backend)
+        return stats
@@ -1,8 +1,11 @@
 from datetime import datetime
+import pytz
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, BooleanField, TextAreaField
-from wtforms.validators import DataRequired, AnyOf, URL, Optional
-from wtforms.fields.html5 import DateTimeLocalField
+from wtforms import StringField, SelectField, SelectMultipleField, BooleanField, TextAreaField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, NumberRange
+from wtforms.fields.html5 import DateTimeLocalField, DateField
+
+MAX_SHOW_DURATION = 24 * 60 # minutes
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -19,6 +22,41 @@ class ShowForm(Form):
         default= datetime.today(),
         format='%Y-%m-%dT%H:%M'
     )
+    duration = IntegerField(
+        'duration',
+        validators=[DataRequired(), NumberRange(min=1, max=MAX_SHOW_DURATION)],
+        default=120
+    )
+
+class ShowSeriesForm(ShowForm):
+    frequency = SelectField(
+        'frequency', validators=[DataRequired()],
+        choices=[
+            ('WEEKLY', 'Weekly'),
+            ('DAILY', 'Daily'),
+            ('MONTHLY', 'Monthly'),
+        ]
+    )
+    interval = IntegerField(
+        'interval',
+        validators=[DataRequired(), NumberRange(min=1, max=52)],
+        default=1
+    )
+    # leave both empty for a series without an end
+    occurrences = IntegerField(
+        'occurrences', validators=[Optional(), NumberRange(min=1, max=1000)]
+    )
+    until = DateField(
+        'until', validators=[Optional()]
+    )
+
+    def validate(self, *args, **kwargs):
+        # a rule may end after COUNT occurrences or at an UNTIL date, not both (RFC 5545)
+        valid = super().validate(*args, **kwargs)
+        if self.occurrences.data is not None and self.until.data is not None:
+            self.until.errors.append('Give either a number of occurrences or an end date, not both.')
+            valid = False
+        return valid
 
 class VenueForm(Form):
     name = StringField(
@@ -128,6 +166,11 @@ class VenueForm(Form):
     seeking_description = TextAreaField(
         'seeking_description'
     )
+    timezone = SelectField(
+        'timezone', validators=[DataRequired()],
+        choices=[(name, name) for name in pytz.common_timezones],
+        default='UTC'
+    )
 
 class ArtistForm(Form):
     name = StringField(
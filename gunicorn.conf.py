@@ -0,0 +1,47 @@
+# Production server settings: gunicorn -c gunicorn.conf.py app:app
+#
+# Each worker process handles `threads` requests at once, so a request waiting on a
+# slow query does not hold up the others. With GUNICORN_WORKER_CLASS=gevent (needs the
+# gevent and psycogreen packages) a worker instead serves up to worker_connections
+# requests on greenlets.
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 200))
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# restart workers now and then so a slow leak can not grow forever
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = "-"
+errorlog = "-"
+
+# Database connections. The app is not preloaded, so each worker opens its own pool of
+# up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections. Unless they are set explicitly they
+# are derived from DB_CONNECTION_BUDGET, the connections all workers of this server may
+# hold together: workers * (pool size + overflow) stays within it. Keep the budget below
+# the database's max_connections (100 by default) less what migrations, commands and
+# other servers need, and split it when running several servers. A worker gets a
+# connection per thread/greenlet if the budget allows; otherwise requests wait up to
+# DB_POOL_TIMEOUT for one.
+connection_budget = int(os.environ.get("DB_CONNECTION_BUDGET", 80))
+worker_budget = max(1, connection_budget // workers)
+concurrency = worker_connections // 4 if worker_class == "gevent" else threads
+pool_size = min(concurrency, worker_budget)
+os.environ.setdefault("DB_POOL_SIZE", str(pool_size))
+os.environ.setdefault("DB_MAX_OVERFLOW", str(worker_budget - pool_size))
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # lets psycopg2 yield to other greenlets while waiting on the database
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
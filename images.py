@@ -0,0 +1,233 @@
+import ipaddress
+import os
+import socket
+import threading
+from http.client import HTTPConnection, HTTPSConnection
+from io import BytesIO
+from urllib.parse import urlparse
+from urllib.request import HTTPHandler, HTTPRedirectHandler, HTTPSHandler, ProxyHandler, Request, build_opener
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# size name -> longest side in pixels
+THUMBNAIL_SIZES = {"small": 160, "medium": 480, "large": 1024}
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class OriginError(Exception):
+    pass
+
+
+class NotAnImage(OriginError):
+    pass
+
+
+def check_link(link):
+    # an http(s) link with a host and a valid port
+    parsed = urlparse(link)
+    try:
+        parsed.port
+    except ValueError:
+        raise OriginError(f"invalid port in {link}")
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise OriginError(f"not an http(s) link: {link}")
+
+
+def public_address(host, port):
+    # Image links are set by anyone through the venue and artist forms, so they must
+    # not make the server fetch from itself or its private network: every address the
+    # host resolves to has to be a public one. Returns the address to connect to, so
+    # the name is not resolved again (to a different address) when connecting.
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    except (OSError, UnicodeError) as error:
+        raise OriginError(f"could not resolve {host}: {error}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or \
+                ip.is_multicast or ip.is_unspecified or not ip.is_global:
+            raise OriginError(f"{host} resolves to a non-public address")
+    if not addresses:
+        raise OriginError(f"could not resolve {host}")
+    return addresses[0]
+
+
+class PublicAddressMixin:
+    # connects to the checked public address of the host; the Host header, and for
+    # HTTPS the SNI name and certificate check, still use the host name
+
+    def connect(self):
+        address = public_address(self.host, self.port)
+        self._create_connection = lambda host_port, *args: socket.create_connection((address, host_port[1]), *args)
+        super().connect()
+
+
+class PublicHTTPConnection(PublicAddressMixin, HTTPConnection):
+    pass
+
+
+class PublicHTTPSConnection(PublicAddressMixin, HTTPSConnection):
+    pass
+
+
+class PublicHTTPHandler(HTTPHandler):
+
+    def do_open(self, http_class, req, **kwargs):
+        return super().do_open(PublicHTTPConnection, req, **kwargs)
+
+
+class PublicHTTPSHandler(HTTPSHandler):
+
+    def do_open(self, http_class, req, **kwargs):
+        return super().do_open(PublicHTTPSConnection, req, **kwargs)
+
+
+class PublicRedirectHandler(HTTPRedirectHandler):
+    # redirects are followed only to http(s) links, which connect to public addresses too
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_link(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class HTTPOrigin:
+    # fetches image links over http(s) from public addresses, refusing anything larger
+    # than max_bytes
+
+    def __init__(self, timeout=5, max_bytes=10 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        # no proxies: the proxy's address would be checked instead of the host's
+        self.opener = build_opener(ProxyHandler({}), PublicHTTPHandler, PublicHTTPSHandler, PublicRedirectHandler)
+
+    def fetch(self, link):
+        check_link(link)
+        try:
+            request = Request(link, headers={"User-Agent": "Fyyur image proxy"})
+            with self.opener.open(request, timeout=self.timeout) as response:
+                data = response.read(self.max_bytes + 1)
+        except (OSError, ValueError) as error:
+            raise OriginError(f"could not fetch {link}: {error}")
+        if len(data) > self.max_bytes:
+            raise OriginError(f"{link} is larger than {self.max_bytes} bytes")
+        return data
+
+
+class FileSystemOrigin:
+    # stand-in for HTTPOrigin when testing: reads the file named like the last part of
+    # the link's path from a local directory
+
+    def __init__(self, root):
+        self.root = root
+
+    def fetch(self, link):
+        name = os.path.basename(urlparse(link).path)
+        try:
+            with open(os.path.join(self.root, name), "rb") as file:
+                return file.read()
+        except (OSError, ValueError) as error:
+            raise OriginError(f"could not read {name}: {error}")
+
+
+def image_mimetype(data):
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def thumbnail(data, size):
+    # data scaled down to fit size x size, as PNG when it has transparency and JPEG
+    # otherwise. Without Pillow installed the original is returned. Raises NotAnImage
+    # for anything but a JPEG, PNG, GIF or WebP image.
+    if image_mimetype(data) is None:
+        raise NotAnImage("not a JPEG, PNG, GIF or WebP image")
+    if Image is None:
+        return data
+    try:
+        image = Image.open(BytesIO(data))
+        image.thumbnail((size, size))
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise NotAnImage(f"not an image: {error}")
+
+    output = BytesIO()
+    if image.mode in ("RGBA", "LA", "P"):
+        image.save(output, "PNG", optimize=True)
+    else:
+        image.convert("RGB").save(output, "JPEG", quality=85, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+class DiskCache:
+    # Files under directory named by key, evicting the least recently used once their
+    # total size passes max_bytes. Reads bump a file's mtime to mark it used. Writes are
+    # atomic renames, so several processes can share the directory; each one counts
+    # the size it has written and rescans the directory when evicting.
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, size, _ in self.entries())
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def entries(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".tmp"):  # being written
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+        with self.lock:
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # drop the least recently used files until 90% of max_bytes is used
+        entries = sorted(self.entries())
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
@@ -0,0 +1,143 @@
+"""Load test harness.
+
+Fires concurrent GET requests at a running server and reports throughput and latency:
+
+    $ python loadtest.py run http://localhost:8000/api/v1/shows --concurrency 32 --requests 2000
+
+or starts the app twice, once as launched by `python app.py` (the Flask development
+server) and once under gunicorn with gunicorn.conf.py, slows every database query
+down by --delay-ms to stand in for a loaded database, and runs the same load against
+both:
+
+    $ python loadtest.py compare --delay-ms 50 --concurrency 32 --requests 1000
+
+The default paths are not served from the page cache, so every request queries the
+database.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+DEFAULT_PATHS = ["/api/v1/venues", "/api/v1/shows", "/venues/search?search_term=a"]
+
+
+def slow_app():
+    # the app, with every query delayed by LOADTEST_DELAY_MS milliseconds
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app
+
+    delay = int(os.environ.get("LOADTEST_DELAY_MS", 0)) / 1000
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def slow_query(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(delay)
+
+    return app
+
+
+def fetch(url):
+    started = time.perf_counter()
+    try:
+        with urlopen(url, timeout=60) as response:
+            response.read()
+            ok = response.status < 500
+    except HTTPError as error:
+        ok = error.code < 500
+    except URLError:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(urls, concurrency, requests):
+    targets = [urls[i % len(urls)] for i in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(fetch, targets))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, ok in results)
+    errors = sum(1 for latency, ok in results if not ok)
+    return {
+        "requests/s": requests / elapsed,
+        "p50 ms": percentile(latencies, 0.50) * 1000,
+        "p95 ms": percentile(latencies, 0.95) * 1000,
+        "p99 ms": percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+    }
+
+
+def report(name, stats):
+    print(f"{name:<12}" + "  ".join(f"{key} {value:9.1f}" for key, value in stats.items()))
+
+
+def wait_until_up(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"server exited with status {process.returncode}")
+        try:
+            urlopen(url, timeout=1).read()
+            return
+        except HTTPError:
+            return
+        except URLError:
+            time.sleep(0.2)
+    sys.exit(f"server at {url} did not come up")
+
+
+def compare(args):
+    env = dict(os.environ, LOADTEST_DELAY_MS=str(args.delay_ms), FYYUR_ENV="production")
+    env.setdefault("SECRET_KEY", os.urandom(16).hex())  # shared by the gunicorn workers
+    servers = {
+        "dev server": (
+            [sys.executable, "-c", "import loadtest; loadtest.slow_app().run(port=5001)"],
+            "http://127.0.0.1:5001"),
+        "gunicorn": (
+            ["gunicorn", "-c", "gunicorn.conf.py", "--bind", "127.0.0.1:5002", "loadtest:slow_app()"],
+            "http://127.0.0.1:5002"),
+    }
+    for name, (command, base_url) in servers.items():
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(base_url + args.paths[0], process)
+            report(name, run([base_url + path for path in args.paths], args.concurrency, args.requests))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="load a running server")
+    run_parser.add_argument("urls", nargs="+")
+
+    compare_parser = commands.add_parser("compare", help="compare the dev server with gunicorn")
+    compare_parser.add_argument("--delay-ms", type=int, default=50, help="added to every database query")
+    compare_parser.add_argument("--path", dest="paths", action="append", help="repeatable")
+
+    for command in (run_parser, compare_parser):
+        command.add_argument("--concurrency", type=int, default=32)
+        command.add_argument("--requests", type=int, default=1000)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        report("server", run(args.urls, args.concurrency, args.requests))
+    else:
+        args.paths = args.paths or DEFAULT_PATHS
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from flask import Response, g, request, signals
+from sqlalchemy import event
+
+# seconds; upper bounds of the latency histogram buckets, +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels):
+    labels = list(labels)  # may be a zip, which is truthy even when empty
+    if not labels:
+        return ""
+    escaped = ("{}=\"{}\"".format(name, str(value).replace("\\", r"\\").replace("\"", r"\"").replace("\n", r"\n"))
+               for name, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def expose(self, type="counter"):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {type}"
+        with self.lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            yield f"{self.name}{format_labels(zip(self.label_names, label_values))} {value}"
+
+
+class Gauge(Counter):
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def expose(self, type="gauge"):
+        return super().expose(type)
+
+
+class Histogram:
+
+    def __init__(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self.values = {}  # label values -> [per-bucket counts (+Inf last), sum]
+        self.lock = Lock()
+
+    def observe(self, value, *label_values):
+        bucket = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][bucket] += 1
+            counts[1] += value
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            values = [(label_values, list(counts), total) for label_values, (counts, total) in self.values.items()]
+        for label_values, counts, total in values:
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(labels + [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{format_labels(labels)} {total}"
+            yield f"{self.name}_count{format_labels(labels)} {cumulative}"
+
+
+class Metrics:
+    # Request, template, connection pool and cache metrics served at /metrics in the
+    # Prometheus text format. Observations only take a lock and bump a number, so this
+    # stays on in production. Values are per process: with several server workers each
+    # one reports its own, scrape them separately or sum them.
+    #
+    # Latency of streamed responses is measured up to the first byte.
+
+    def __init__(self, app=None, db=None):
+        self.requests = Counter(
+            "fyyur_http_requests_total", "HTTP requests by route, method and status.",
+            ("route", "method", "status"))
+        self.latency = Histogram(
+            "fyyur_http_request_duration_seconds", "HTTP request latency by route.",
+            ("route", "method"))
+        self.in_flight = Gauge("fyyur_http_requests_in_flight", "Requests being handled.")
+        self.exceptions = Counter(
+            "fyyur_http_exceptions_total", "Unhandled exceptions raised by views, by route.", ("route",))
+        self.render_time = Histogram(
+            "fyyur_template_render_seconds", "Template render time by template.", ("template",))
+        self.pool_checkouts = Counter("fyyur_db_pool_checkouts_total", "Connections checked out of the pool.")
+        self.collectors = []
+        self.in_flight.inc(amount=0)
+        self.pool_checkouts.inc(amount=0)
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        app.config.setdefault("METRICS_PATH", "/metrics")
+        app.before_request(self.start_request)
+        app.after_request(self.end_request)
+        app.teardown_request(self.teardown_request)
+        # template and exception signals need the blinker package
+        signals.before_render_template.connect(self.start_render, app)
+        signals.template_rendered.connect(self.end_render, app)
+        signals.got_request_exception.connect(self.count_exception, app)
+        with app.app_context():
+            event.listen(db.engine, "checkout", self.count_checkout)
+        app.add_url_rule(app.config["METRICS_PATH"], "metrics", self.metrics_view)
+
+    def register(self, name, help, collect, type="gauge"):
+        # collect() returns the current value, read when /metrics is scraped
+        self.collectors.append((name, help, collect, type))
+
+    @staticmethod
+    def route():
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    def start_request(self):
+        g.metrics_start = time.perf_counter()
+        self.in_flight.inc()
+
+    def end_request(self, response):
+        started = g.get("metrics_start")
+        if started is not None:
+            route = self.route()
+            self.latency.observe(time.perf_counter() - started, route, request.method)
+            self.requests.inc(route, request.method, str(response.status_code))
+        return response
+
+    def teardown_request(self, exception):
+        if g.pop("metrics_start", None) is not None:
+            self.in_flight.dec()
+
+    def start_render(self, app, template, context):
+        g.setdefault("metrics_render_start", []).append(time.perf_counter())
+
+    def end_render(self, app, template, context):
+        starts = g.get("metrics_render_start")
+        if starts:
+            self.render_time.observe(time.perf_counter() - starts.pop(), template.name or "string")
+
+    def count_exception(self, app, exception):
+        self.exceptions.inc(self.route())
+
+    def count_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.pool_checkouts.inc()
+
+    def pool_stats(self):
+        # QueuePool sizes; pools without them (e.g. NullPool) report only checkouts
+        pool = self.db.engine.pool
+        for name, help, stat in (
+            ("fyyur_db_pool_size", "Configured pool size.", "size"),
+            ("fyyur_db_pool_checked_out", "Connections currently checked out.", "checkedout"),
+            ("fyyur_db_pool_checked_in", "Idle connections in the pool.", "checkedin"),
+            ("fyyur_db_pool_overflow", "Connections open beyond the pool size.", "overflow"),
+        ):
+            if hasattr(pool, stat):
+                yield f"# HELP {name} {help}"
+                yield f"# TYPE {name} gauge"
+                yield f"{name} {getattr(pool, stat)()}"
+
+    def expose(self):
+        for metric in (self.requests, self.latency, self.in_flight, self.exceptions,
+                       self.render_time, self.pool_checkouts):
+            yield from metric.expose()
+        yield from self.pool_stats()
+        for name, help, collect, type in self.collectors:
+            yield f"# HELP {name} {help}"
+            yield f"# TYPE {name} {type}"
+            yield f"{name} {collect()}"
+
+    def metrics_view(self):
+        return Response("\n".join(self.expose()) + "\n", content_type="text/plain; version=0.0.4; charset=utf-8")
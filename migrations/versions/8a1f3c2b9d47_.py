@@ -0,0 +1,35 @@
+"""search indexes for venues and artists
+
+Revision ID: 8a1f3c2b9d47
+Revises: d5ad8841da80
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a1f3c2b9d47'
+down_revision = 'd5ad8841da80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the tsvector expression must stay identical to search_document() in app.py
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        op.execute(
+            f'CREATE INDEX ix_{table.lower()}_search ON "{table}" USING gin '
+            f"(to_tsvector('simple'::regconfig, name || ' ' || city || ' ' || state))"
+        )
+        op.execute(
+            f'CREATE INDEX ix_{table.lower()}_name_trgm ON "{table}" USING gin (name gin_trgm_ops)'
+        )
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_index(f'ix_{table.lower()}_name_trgm', table_name=table)
+        op.drop_index(f'ix_{table.lower()}_search', table_name=table)
@@ -0,0 +1,43 @@
+"""recurring show series
+
+Revision ID: a4d8e2f6b351
+Revises: f3a6c9b2e814
+Create Date: 2026-10-18 16:02:47.219530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8e2f6b351'
+down_revision = 'f3a6c9b2e814'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowSeries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('duration', sa.Integer(), nullable=False),
+    sa.Column('rule', sa.String(length=200), nullable=False),
+    sa.Column('materialized_until', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.add_column('Show', sa.Column('series_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_Show_series_id'), 'Show', ['series_id'], unique=False)
+    op.create_foreign_key('Show_series_id_fkey', 'Show', 'ShowSeries', ['series_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    op.drop_constraint('Show_series_id_fkey', 'Show', type_='foreignkey')
+    op.drop_index(op.f('ix_Show_series_id'), table_name='Show')
+    op.drop_column('Show', 'series_id')
+    op.drop_table('ShowSeries')
@@ -0,0 +1,34 @@
+"""upcoming show counters on Venue and Artist
+
+Revision ID: b3e94d0c5a16
+Revises: 8a1f3c2b9d47
+Create Date: 2026-10-18 10:03:12.540877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e94d0c5a16'
+down_revision = '8a1f3c2b9d47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('upcoming_shows_counter', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('upcoming_shows_counter', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE "Venue" SET upcoming_shows_counter = '
+        '(SELECT count(*) FROM "Show" WHERE "Show".venue_id = "Venue".id AND "Show".start_time > now())'
+    )
+    op.execute(
+        'UPDATE "Artist" SET upcoming_shows_counter = '
+        '(SELECT count(*) FROM "Show" WHERE "Show".artist_id = "Artist".id AND "Show".start_time > now())'
+    )
+
+
+def downgrade():
+    op.drop_column('Artist', 'upcoming_shows_counter')
+    op.drop_column('Venue', 'upcoming_shows_counter')
@@ -0,0 +1,49 @@
+"""timestamptz show times and venue time zones
+
+Revision ID: b6e1f9a3c527
+Revises: a4d8e2f6b351
+Create Date: 2026-10-18 17:41:09.583617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1f9a3c527'
+down_revision = 'a4d8e2f6b351'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing venues get UTC, and existing show times are taken as UTC, so every show
+    # is still shown at the time it was entered. Set each venue's real time zone after
+    # upgrading to have shows entered from then on converted from it.
+    op.add_column('Venue', sa.Column('timezone', sa.String(length=64), server_default='UTC', nullable=False))
+
+    # the exclusion constraints use tsrange, which doesn't take timestamptz
+    for column in ('artist_id', 'venue_id'):
+        op.drop_constraint(f'show_{column}_no_overlap', 'Show')
+    for column in ('start_time', 'end_time'):
+        op.alter_column('Show', column, type_=sa.DateTime(timezone=True), existing_nullable=False,
+                        postgresql_using=f"{column} AT TIME ZONE 'UTC'")
+    for column in ('venue_id', 'artist_id'):
+        op.execute(
+            f'ALTER TABLE "Show" ADD CONSTRAINT show_{column}_no_overlap '
+            f'EXCLUDE USING gist ({column} WITH =, tstzrange(start_time, end_time) WITH &&)'
+        )
+
+
+def downgrade():
+    for column in ('artist_id', 'venue_id'):
+        op.drop_constraint(f'show_{column}_no_overlap', 'Show')
+    for column in ('start_time', 'end_time'):
+        op.alter_column('Show', column, type_=sa.DateTime(), existing_nullable=False,
+                        postgresql_using=f"{column} AT TIME ZONE 'UTC'")
+    for column in ('venue_id', 'artist_id'):
+        op.execute(
+            f'ALTER TABLE "Show" ADD CONSTRAINT show_{column}_no_overlap '
+            f'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)'
+        )
+    op.drop_column('Venue', 'timezone')
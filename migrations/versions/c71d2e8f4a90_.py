@@ -0,0 +1,69 @@
+"""normalize genres into Genre with association tables
+
+Revision ID: c71d2e8f4a90
+Revises: b3e94d0c5a16
+Create Date: 2026-10-18 11:26:05.302511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71d2e8f4a90'
+down_revision = 'b3e94d0c5a16'
+branch_labels = None
+depends_on = None
+
+# (owner table, association table, owner foreign key column, old genres column type)
+GENRE_TABLES = (
+    ('Venue', 'VenueGenre', 'venue_id', sa.String()),
+    ('Artist', 'ArtistGenre', 'artist_id', sa.String(length=120)),
+)
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for owner, association, owner_key, _ in GENRE_TABLES:
+        op.create_table(association,
+        sa.Column(owner_key, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([owner_key], [f'{owner}.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint(owner_key, 'genre_id')
+        )
+        op.create_index(f'ix_{owner.lower()}_genre_genre_id', association, ['genre_id', owner_key])
+
+    # move the comma separated genre strings into the new tables
+    for owner, association, owner_key, _ in GENRE_TABLES:
+        op.execute(
+            f'INSERT INTO "Genre" (name) '
+            f'SELECT DISTINCT trim(g) FROM "{owner}", unnest(string_to_array(genres, \',\')) AS g '
+            f"WHERE trim(g) <> '' ON CONFLICT (name) DO NOTHING"
+        )
+        op.execute(
+            f'INSERT INTO "{association}" ({owner_key}, genre_id) '
+            f'SELECT DISTINCT o.id, "Genre".id FROM "{owner}" o, unnest(string_to_array(o.genres, \',\')) AS g '
+            f'JOIN "Genre" ON "Genre".name = trim(g)'
+        )
+        op.drop_column(owner, 'genres')
+
+
+def downgrade():
+    for owner, association, owner_key, column_type in GENRE_TABLES:
+        op.add_column(owner, sa.Column('genres', column_type, nullable=True))
+        op.execute(
+            f'UPDATE "{owner}" o SET genres = ('
+            f'SELECT string_agg("Genre".name, \',\' ORDER BY "Genre".name) FROM "{association}" '
+            f'JOIN "Genre" ON "Genre".id = "{association}".genre_id WHERE "{association}".{owner_key} = o.id)'
+        )
+        op.execute(f'UPDATE "{owner}" SET genres = \'\' WHERE genres IS NULL')
+        op.alter_column(owner, 'genres', existing_type=column_type, nullable=False)
+        op.drop_index(f'ix_{owner.lower()}_genre_genre_id', table_name=association)
+        op.drop_table(association)
+    op.drop_table('Genre')
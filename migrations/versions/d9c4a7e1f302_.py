@@ -0,0 +1,39 @@
+"""indexes for hot lookup columns
+
+Revision ID: d9c4a7e1f302
+Revises: c71d2e8f4a90
+Create Date: 2026-10-18 12:40:51.774190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9c4a7e1f302'
+down_revision = 'c71d2e8f4a90'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns); built CONCURRENTLY so writes aren't blocked on a live database
+INDEXES = (
+    ('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time']),
+    ('ix_show_artist_id_start_time', 'Show', ['artist_id', 'start_time']),
+    ('ix_show_start_time_id', 'Show', ['start_time', 'id']),
+    ('ix_venue_state_city', 'Venue', ['state', 'city']),
+    ('ix_venue_created_at', 'Venue', [sa.text('created_at DESC')]),
+    ('ix_artist_created_at', 'Artist', [sa.text('created_at DESC')]),
+)
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
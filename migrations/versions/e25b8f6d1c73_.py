@@ -0,0 +1,31 @@
+"""updated_at on Venue, Artist and Show
+
+Revision ID: e25b8f6d1c73
+Revises: d9c4a7e1f302
+Create Date: 2026-10-18 13:52:19.610245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e25b8f6d1c73'
+down_revision = 'd9c4a7e1f302'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "Venue" SET updated_at = created_at')
+    op.execute('UPDATE "Artist" SET updated_at = created_at')
+    op.execute("UPDATE \"Show\" SET updated_at = now() at time zone 'utc'")
+    for table in ('Venue', 'Artist', 'Show'):
+        op.alter_column(table, 'updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
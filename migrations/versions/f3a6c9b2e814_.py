@@ -0,0 +1,38 @@
+"""show end times and double-booking exclusion constraints
+
+Revision ID: f3a6c9b2e814
+Revises: e25b8f6d1c73
+Create Date: 2026-10-18 15:08:33.481902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a6c9b2e814'
+down_revision = 'e25b8f6d1c73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # existing shows get the form's default duration of two hours
+    op.execute("UPDATE \"Show\" SET end_time = start_time + interval '2 hours'")
+    op.alter_column('Show', 'end_time', existing_type=sa.DateTime(), nullable=False)
+
+    # btree_gist lets the integer ids take part in a GiST exclusion constraint. Adding
+    # the constraints fails if existing shows already overlap; resolve those first.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for column in ('venue_id', 'artist_id'):
+        op.execute(
+            f'ALTER TABLE "Show" ADD CONSTRAINT show_{column}_no_overlap '
+            f'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)'
+        )
+
+
+def downgrade():
+    for column in ('artist_id', 'venue_id'):
+        op.drop_constraint(f'show_{column}_no_overlap', 'Show')
+    op.drop_column('Show', 'end_time')
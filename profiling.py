@@ -0,0 +1,139 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, render_template, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# "IN (%(id_1)s, %(id_2)s, ...)" and literal numbers vary between otherwise identical
+# statements; both are folded so repeats of one statement shape are counted together
+BIND_LIST_RE = re.compile(r"\((?:\s*(?:%\(\w+\)s|\?|:\w+)\s*,?)+\)")
+NUMBER_RE = re.compile(r"\b\d+\b")
+SPACE_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    shape = BIND_LIST_RE.sub("(?)", statement)
+    shape = NUMBER_RE.sub("N", shape)
+    return SPACE_RE.sub(" ", shape).strip()
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.queries = []  # (statement, seconds)
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.queries.append((statement, seconds))
+        self.shapes[statement_shape(statement)] += 1
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(seconds for statement, seconds in self.queries)
+
+    def duplicates(self, threshold=1):
+        # statement shapes issued more than threshold times, most repeated first
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+@contextmanager
+def recorded_queries():
+    # RequestProfile of every statement run inside the block, whether or not the
+    # profiler is enabled; used by the benchmark and check commands
+    profile = RequestProfile()
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("recorded_query_start", []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        profile.record(statement, time.perf_counter() - conn.info["recorded_query_start"].pop())
+
+    event.listen(Engine, "before_cursor_execute", before)
+    event.listen(Engine, "after_cursor_execute", after)
+    try:
+        yield profile
+    finally:
+        event.remove(Engine, "before_cursor_execute", before)
+        event.remove(Engine, "after_cursor_execute", after)
+
+
+class QueryProfiler:
+    # Records the SQL statements every request runs, through engine events, and reports
+    # their count and total time in the X-Query-Count and Server-Timing response headers.
+    # In debug mode a panel listing the statements is appended to HTML pages. A request
+    # repeating one statement shape more than SQL_PROFILER_DUPLICATE_THRESHOLD times,
+    # the mark of an N+1 query, is logged as a warning.
+    #
+    # Statements run while a streamed response is being sent are not included.
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SQL_PROFILER", app.debug)
+        app.config.setdefault("SQL_PROFILER_DUPLICATE_THRESHOLD", 5)
+        app.config.setdefault("SQL_PROFILER_PANEL", app.debug)
+        if not app.config["SQL_PROFILER"]:
+            return
+        self.app = app
+
+        # listening on the Engine class also covers engines created later (e.g. replicas)
+        event.listen(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_cursor_execute)
+        app.before_request(self.start_profile)
+        app.after_request(self.report_profile)
+
+    @staticmethod
+    def current_profile():
+        if has_request_context():
+            return g.get("sql_profile")
+        return None
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start_time"].pop()
+        profile = self.current_profile()
+        if profile is not None:
+            profile.record(statement, time.perf_counter() - started)
+
+    def start_profile(self):
+        g.sql_profile = RequestProfile()
+
+    def report_profile(self, response):
+        profile = g.get("sql_profile")
+        if profile is None:
+            return response
+
+        response.headers["X-Query-Count"] = str(profile.count)
+        response.headers.add(
+            "Server-Timing", f'db;dur={profile.total_time * 1000:.1f};desc="{profile.count} queries"'
+        )
+
+        threshold = self.app.config["SQL_PROFILER_DUPLICATE_THRESHOLD"]
+        duplicates = profile.duplicates(threshold)
+        for shape, count in duplicates:
+            self.app.logger.warning(
+                "%s %s repeated a statement %d times, likely an N+1 query: %s",
+                request.method, request.full_path, count, shape
+            )
+
+        if (self.app.config["SQL_PROFILER_PANEL"] and response.mimetype == "text/html"
+                and not response.is_streamed and not response.direct_passthrough):
+            body = response.get_data(as_text=True)
+            if "</body>" in body:
+                panel = render_template(
+                    "debug/sql_panel.html", profile=profile,
+                    duplicates=profile.duplicates(), threshold=threshold
+                )
+                response.set_data(body.replace("</body>", panel + "</body>", 1))
+        return response
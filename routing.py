@@ -0,0 +1,113 @@
+import time
+from functools import wraps
+from itertools import count
+from threading import Lock
+
+from flask import g, has_request_context, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine.url import make_url
+
+
+class ReplicaRouter:
+    # Picks the read replica a read-only view queries. A replica that fails to connect
+    # or drops its connection is skipped for REPLICA_RETRY_AFTER seconds; when every
+    # replica is down the primary is used. The request hitting the failure still fails.
+    #
+    # Requests are kept on the primary for REPLICA_STICKY_SECONDS after the client
+    # committed a write, so the page it is redirected to shows the change even while
+    # the replicas lag behind.
+
+    def __init__(self):
+        self.engines = []
+        self.down_until = {}
+        self.turn = count()
+        self.lock = Lock()
+        self.app = None
+
+    def init_app(self, app):
+        app.config.setdefault("REPLICA_URIS", [])
+        app.config.setdefault("REPLICA_SELECTION", "round-robin")
+        app.config.setdefault("REPLICA_RETRY_AFTER", 30)
+        app.config.setdefault("REPLICA_STICKY_SECONDS", 10)
+        self.app = app
+        app.after_request(self.remember_write)
+
+    def replicas(self):
+        # engines are created on first use, with the primary's pool options when they
+        # are PostgreSQL too (the options are PostgreSQL specific)
+        if not self.engines and self.app.config["REPLICA_URIS"]:
+            with self.lock:
+                if not self.engines:
+                    engines = [create_engine(uri, **self.engine_options(uri)) for uri in self.app.config["REPLICA_URIS"]]
+                    for engine in engines:
+                        event.listen(engine, "handle_error", self.replica_error)
+                    self.engines = engines
+        return self.engines
+
+    def engine_options(self, uri):
+        if not make_url(uri).get_backend_name().startswith("postgres"):
+            return {}
+        return self.app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+
+    def replica_error(self, context):
+        if context.is_disconnect or context.connection is None:
+            self.down_until[context.engine] = time.monotonic() + self.app.config["REPLICA_RETRY_AFTER"]
+
+    def pick(self):
+        now = time.monotonic()
+        up = [engine for engine in self.replicas() if self.down_until.get(engine, 0) <= now]
+        if not up:
+            return None
+        if self.app.config["REPLICA_SELECTION"] == "least-connections":
+            return min(up, key=lambda engine: getattr(engine.pool, "checkedout", lambda: 0)())
+        return up[next(self.turn) % len(up)]
+
+    def reads(self, view):
+        # routes the queries of a read-only view to a replica
+        @wraps(view)
+        def wrapper(**view_args):
+            if session.get("primary_until", 0) < time.time():
+                g.replica = self.pick()
+            return view(**view_args)
+        return wrapper
+
+    @staticmethod
+    def current_replica():
+        return g.get("replica") if has_request_context() else None
+
+    def remember_write(self, response):
+        if g.get("wrote"):
+            session["primary_until"] = time.time() + self.app.config["REPLICA_STICKY_SECONDS"]
+        return response
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = ReplicaRouter.current_replica()
+        if replica is not None and not self._flushing:
+            return replica
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def note_write(session):
+    if has_request_context() and g.get("replica") is None:
+        g.wrote = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    # SQLAlchemy whose sessions send the queries of views wrapped in db.router.reads
+    # to a read replica; everything else, and any flush, goes to the primary.
+
+    def __init__(self, app=None, **kwargs):
+        self.router = ReplicaRouter()
+        super().__init__(app, **kwargs)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.router.init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
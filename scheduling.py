@@ -0,0 +1,29 @@
+from bisect import bisect_left
+
+
+class Calendar:
+    # The booked [start, end) intervals of one venue or artist, sorted by start. Bookings
+    # never overlap, so ends are sorted too and the only booking that can overlap a new
+    # interval is the last one starting before it ends: conflict checks are O(log n).
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            self.starts.append(start)
+            self.ends.append(end)
+
+    def conflict(self, start, end):
+        # the booked (start, end) overlapping [start, end), or None
+        position = bisect_left(self.starts, end)
+        if position and self.ends[position - 1] > start:
+            return self.starts[position - 1], self.ends[position - 1]
+        return None
+
+    def add(self, start, end):
+        position = bisect_left(self.starts, start)
+        self.starts.insert(position, start)
+        self.ends.insert(position, end)
+
+    def __len__(self):
+        return len(self.starts)
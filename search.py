@@ -0,0 +1,78 @@
+import re
+import time
+from bisect import bisect_left
+from threading import Lock
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def prefix_tsquery(term):
+    # "new yo" -> "new:* & yo:*" so every word of the search term matches as a prefix
+    return " & ".join(f"{token}:*" for token in tokenize(term))
+
+
+class SearchIndex:
+    # In-process prefix index used when the database is not PostgreSQL (e.g. SQLite
+    # for local testing). `load` returns (id, *text_fields) rows; the index is rebuilt
+    # from it lazily after invalidate() is called by the write views. The index is per
+    # process and other processes' writes don't invalidate it, so it is also rebuilt
+    # once it is older than timeout seconds.
+
+    def __init__(self, load, timeout=60):
+        self.load = load
+        self.timeout = timeout
+        self.lock = Lock()
+        self.stale = True
+        self.built_at = 0
+        self.postings = []  # sorted (token, id) pairs
+        self.names = {}
+
+    def invalidate(self):
+        self.stale = True
+
+    def rebuild(self):
+        postings = set()
+        names = {}
+        for id, name, *fields in self.load():
+            names[id] = name
+            for field in (name, *fields):
+                for token in tokenize(field or ""):
+                    postings.add((token, id))
+        self.postings = sorted(postings)
+        self.names = names
+        self.stale = False
+        self.built_at = time.monotonic()
+
+    def prefix_matches(self, prefix):
+        # ids having a token starting with prefix, with whether the token matched exactly
+        matches = {}
+        position = bisect_left(self.postings, (prefix,))
+        while position < len(self.postings):
+            token, id = self.postings[position]
+            if not token.startswith(prefix):
+                break
+            matches[id] = matches.get(id, False) or token == prefix
+            position += 1
+        return matches
+
+    def search(self, term):
+        # ids matching every word of term as a prefix, best matches first
+        with self.lock:
+            if self.stale or time.monotonic() - self.built_at > self.timeout:
+                self.rebuild()
+            tokens = tokenize(term)
+            if not tokens:
+                return sorted(self.names, key=lambda id: (self.names[id], id))
+
+            scores = None
+            for token in tokens:
+                matches = self.prefix_matches(token)
+                if scores is None:
+                    scores = {id: int(exact) for id, exact in matches.items()}
+                else:
+                    scores = {id: score + int(matches[id]) for id, score in scores.items() if id in matches}
+            return sorted(scores, key=lambda id: (-scores[id], self.names[id], id))